@@ -0,0 +1,48 @@
+"""
+Rating histograms for brand and flavor analytics
+
+Ratings are small integers, so a histogram of count per rating value is an
+exact sketch: histograms from any set of brands, flavors or shards merge by
+adding counts, and percentiles come straight from the cumulative counts.
+"""
+
+import math
+from collections import Counter
+
+PERCENTILES = (25, 50, 75, 90)
+
+def to_histogram(counts):
+    """Convert stored counts ({'4': 12, ...}) into a histogram keyed by int rating"""
+    return Counter({int(rating): count for rating, count in (counts or {}).items() if count > 0})
+
+def merge_histograms(histograms):
+    """Add several histograms together"""
+    merged = Counter()
+    for histogram in histograms:
+        merged.update(histogram)
+    return merged
+
+def percentile(histogram, p):
+    """Nearest-rank percentile of a histogram, or None if it is empty"""
+    total = sum(histogram.values())
+    if not total:
+        return None
+    rank = max(1, math.ceil(p / 100 * total))
+    seen = 0
+    for rating in sorted(histogram):
+        seen += histogram[rating]
+        if seen >= rank:
+            return rating
+    return max(histogram)
+
+def summarize(histogram):
+    """Count, mean, percentiles and distribution of a rating histogram"""
+    total = sum(histogram.values())
+    summary = {
+        'count': total,
+        'mean': round(sum(rating * count for rating, count in histogram.items()) / total, 2) if total else None,
+        'distribution': {str(rating): histogram[rating] for rating in sorted(histogram)}
+    }
+    for p in PERCENTILES:
+        summary[f'p{p}'] = percentile(histogram, p)
+    return summary
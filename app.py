@@ -1,12 +1,19 @@
 from flask import Flask, render_template, request, jsonify, session, redirect, url_for, flash
 from flask_login import LoginManager, UserMixin, login_user, logout_user, login_required, current_user
 from werkzeug.security import generate_password_hash, check_password_hash
-from pymongo import MongoClient
 from bson import ObjectId
+from pymongo import InsertOne, ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError, CollectionInvalid, DuplicateKeyError
 from datetime import datetime, timedelta
 import os
+import threading
+import time
+import weakref
 from dotenv import load_dotenv
 import json
+from storage import MemoryStorage, MongoStorage
+from sharding import ShardKeyCollection
+from analytics import merge_histograms, summarize, to_histogram
 
 # Load environment variables
 load_dotenv()
@@ -14,15 +21,87 @@ load_dotenv()
 app = Flask(__name__)
 app.secret_key = os.getenv('SECRET_KEY', 'dev-secret-key-change-in-production')
 
-# MongoDB connection
+# Storage backend: 'mongo' talks to MONGODB_URI (connecting on first use),
+# 'memory' keeps everything in process for tests and local benchmarking
 MONGODB_URI = os.getenv('MONGODB_URI', 'mongodb://localhost:27017/seltzertracker')
-client = MongoClient(MONGODB_URI)
-db = client[os.getenv('MONGODB_DATABASE', 'seltzertracker')]
+MONGODB_DATABASE = os.getenv('MONGODB_DATABASE', 'seltzertracker')
+SELTZER_STORAGE_BACKEND = os.getenv('SELTZER_STORAGE_BACKEND', 'mongo')
+
+if SELTZER_STORAGE_BACKEND == 'memory':
+    storage = MemoryStorage()
+else:
+    storage = MongoStorage(MONGODB_URI, MONGODB_DATABASE)
+
+# Storage backends whose collections and indexes have been set up (see ensure_schema)
+_prepared_storages = weakref.WeakSet()
+_preparing_storages = weakref.WeakSet()
+_prepare_lock = threading.RLock()
+# Storage backends whose brands collection couldn't get its unique indexes
+_unindexed_brand_storages = weakref.WeakSet()
+
+def get_db():
+    """Return the application database, setting up its schema on first use"""
+    database = storage.database()
+    if storage not in _prepared_storages:
+        with _prepare_lock:
+            # ensure_schema uses the collections itself, so let the preparing thread through
+            if storage not in _prepared_storages and storage not in _preparing_storages:
+                _preparing_storages.add(storage)
+                try:
+                    ensure_schema(database)
+                    _prepared_storages.add(storage)
+                finally:
+                    _preparing_storages.discard(storage)
+    return database
+
+class LazyCollection:
+    """Collection handle resolved against the active storage backend on each use"""
+    def __init__(self, name):
+        self.name = name
+
+    def __getattr__(self, attr):
+        return getattr(get_db()[self.name], attr)
+
+# Seltzer storage mode: 'standard' keeps entries in a plain collection,
+# 'timeseries' keeps them in a MongoDB time-series collection keyed by user
+SELTZER_STORAGE_MODE = os.getenv('SELTZER_STORAGE_MODE', 'standard')
+SELTZERS_COLLECTION = os.getenv(
+    'SELTZERS_COLLECTION',
+    'seltzers_ts' if SELTZER_STORAGE_MODE == 'timeseries' else 'seltzers'
+)
+TIMESERIES_OPTIONS = {
+    'timeField': 'consumed_at',
+    'metaField': 'user_id',
+    'granularity': 'hours'
+}
+# Field the routes sort and range-query entries on: the timeField in time-series mode
+SELTZER_TIME_FIELD = TIMESERIES_OPTIONS['timeField'] if SELTZER_STORAGE_MODE == 'timeseries' else 'created_at'
+
+# Entries older than this are moved out of the seltzers collection by archive_seltzers.py
+ARCHIVE_AFTER_MONTHS = int(os.getenv('ARCHIVE_AFTER_MONTHS', '12'))
+SELTZERS_ARCHIVE_COLLECTION = os.getenv('SELTZERS_ARCHIVE_COLLECTION', 'seltzers_archive')
+
+# Untargeted operations on per-user collections are logged ('warn'), raise ('reject') or pass ('off')
+SHARD_KEY_ENFORCEMENT = os.getenv('SHARD_KEY_ENFORCEMENT', 'warn')
 
 # Collections
-users_collection = db.users
-seltzers_collection = db.seltzers
-brands_collection = db.brands
+users_collection = LazyCollection('users')
+brands_collection = LazyCollection('brands')
+# Small documents of app-wide state, e.g. the brand catalog version
+meta_collection = LazyCollection('meta')
+# Rating histogram per brand and flavor across all users, kept up to date on every write
+rating_sketches_collection = LazyCollection('rating_sketches')
+
+# Seconds a worker serves /api/analytics/ratings from its cached sketches before re-reading them
+RATING_ANALYTICS_TTL = float(os.getenv('RATING_ANALYTICS_TTL', '5'))
+_rating_analytics_cache = {}
+# Per-user collections: every operation must include user_id, the shard key
+seltzers_collection = ShardKeyCollection(LazyCollection(SELTZERS_COLLECTION), mode=SHARD_KEY_ENFORCEMENT)
+# Archived entries, and per-user/brand totals folded in from them before archiving
+seltzers_archive_collection = ShardKeyCollection(LazyCollection(SELTZERS_ARCHIVE_COLLECTION), mode=SHARD_KEY_ENFORCEMENT)
+seltzer_rollups_collection = ShardKeyCollection(LazyCollection('seltzer_rollups'), mode=SHARD_KEY_ENFORCEMENT)
+# Which entries went to NDJSON files, with the fields the rollups need
+seltzer_ndjson_entries_collection = ShardKeyCollection(LazyCollection('seltzer_ndjson_entries'), mode=SHARD_KEY_ENFORCEMENT)
 
 # Flask-Login setup
 login_manager = LoginManager()
@@ -43,6 +122,96 @@ def load_user(user_id):
         return User(user_data)
     return None
 
+def ensure_timeseries_collection(database, name):
+    """Create the time-series collection for seltzer entries, or check that the existing one is time-series"""
+    existing = list(database.list_collections(filter={'name': name}))
+    if not existing:
+        database.create_collection(name, timeseries=TIMESERIES_OPTIONS)
+        print(f"Time-series collection '{name}' created")
+    elif existing[0].get('type') != 'timeseries':
+        raise CollectionInvalid(
+            f"Collection '{name}' exists but is not a time-series collection. "
+            f"Drop or rename it, then run migrate_timeseries.py --target {name}"
+        )
+
+def ensure_schema(database):
+    """Create the collections and indexes the routes rely on; runs once per storage backend"""
+    if SELTZER_STORAGE_MODE == 'timeseries':
+        # Time-series collections are indexed on (metaField, timeField) already
+        ensure_timeseries_collection(database, SELTZERS_COLLECTION)
+    else:
+        database[SELTZERS_COLLECTION].create_index([('user_id', 1), (SELTZER_TIME_FIELD, -1)])
+    
+    # Brand names and ids are unique, so writes don't need to check first
+    try:
+        database['brands'].create_index('id', unique=True)
+        database['brands'].create_index('name', unique=True)
+    except DuplicateKeyError as e:
+        print(f"⚠️  Brands have duplicate names or ids, checking brand writes for duplicates instead: {e}")
+        _unindexed_brand_storages.add(storage)
+    database['rating_sketches'].create_index([('brand', 1), ('flavor', 1)], unique=True)
+
+def brand_indexes_unique():
+    """Whether the unique brand indexes exist, so brand writes can rely on them"""
+    get_db()
+    return storage not in _unindexed_brand_storages
+
+def parse_consumed_at(date_str, time_str, fallback=None):
+    """Build a consumed-at datetime from the form's date and time strings"""
+    if not date_str:
+        return fallback
+    try:
+        return datetime.strptime(f"{date_str} {time_str or '00:00'}", '%Y-%m-%d %H:%M')
+    except ValueError:
+        return fallback
+
+def serialize_seltzer(seltzer, archived=False):
+    """Convert a seltzer document into a JSON-friendly dict.
+
+    Entries written before the time-series mode have no consumed_at, so it is
+    derived from the date/time strings to keep responses the same in both modes.
+    """
+    if archived:
+        seltzer['archived'] = True
+    if 'consumed_at' not in seltzer:
+        seltzer['consumed_at'] = parse_consumed_at(
+            seltzer.get('date'), seltzer.get('time'), seltzer.get('created_at')
+        )
+    seltzer['_id'] = str(seltzer['_id'])
+    for field in ('created_at', 'updated_at', 'consumed_at'):
+        if isinstance(seltzer.get(field), datetime):
+            seltzer[field] = seltzer[field].isoformat()
+    return seltzer
+
+def catalog_version():
+    """Return the current brand catalog version"""
+    meta = meta_collection.find_one({'_id': 'catalog'})
+    return meta['version'] if meta else 0
+
+def bump_catalog_version():
+    """Record a change to the brand catalog and return the new version"""
+    meta = meta_collection.find_one_and_update(
+        {'_id': 'catalog'},
+        {'$inc': {'version': 1}},
+        upsert=True,
+        return_document=ReturnDocument.AFTER
+    )
+    return meta['version']
+
+def rating_sketch_update(brand, flavor, rating, delta):
+    """Bulk write request adding delta to one rating in a brand/flavor sketch"""
+    return UpdateOne(
+        {'brand': brand, 'flavor': flavor},
+        {'$inc': {f'counts.{rating}': delta}},
+        upsert=True
+    )
+
+def record_ratings(updates):
+    """Apply sketch updates and drop this worker's cached analytics"""
+    if updates:
+        rating_sketches_collection.bulk_write(updates, ordered=False)
+        _rating_analytics_cache.clear()
+
 # Initialize default data
 def init_default_data():
     # Check if brands already exist
@@ -220,40 +389,64 @@ def admin_logout():
 @app.route('/api/seltzers', methods=['GET'])
 @login_required
 def get_seltzers():
-    """Get all seltzers for the current user"""
+    """Get the current user's seltzers, newest first.
+
+    limit sets the page size and before (the _id of the last entry already
+    shown) fetches the next page. The archive is only read when a page runs
+    past the oldest live entry; without a limit only live entries are returned.
+    """
     limit = request.args.get('limit', type=int)
+    before_id = request.args.get('before')
+    sort = [(SELTZER_TIME_FIELD, -1), ('_id', -1)]
+    
+    page_filter = {'user_id': current_user.id}
+    if before_id:
+        if not ObjectId.is_valid(before_id):
+            return jsonify({'error': 'Invalid before cursor'}), 400
+        owner = {'_id': ObjectId(before_id), 'user_id': current_user.id}
+        before = seltzers_collection.find_one(owner) or seltzers_archive_collection.find_one(owner)
+        if not before:
+            return jsonify({'error': 'Seltzer not found'}), 404
+        page_filter['$or'] = [
+            {SELTZER_TIME_FIELD: {'$lt': before[SELTZER_TIME_FIELD]}},
+            {SELTZER_TIME_FIELD: before[SELTZER_TIME_FIELD], '_id': {'$lt': before['_id']}}
+        ]
     
-    query = seltzers_collection.find({'user_id': current_user.id}).sort('created_at', -1)
+    query = seltzers_collection.find(page_filter).sort(sort)
     if limit:
         query = query.limit(limit)
-    
     seltzers = list(query)
     
-    # Convert ObjectId to string for JSON serialization
-    for seltzer in seltzers:
-        seltzer['_id'] = str(seltzer['_id'])
-        seltzer['created_at'] = seltzer['created_at'].isoformat()
+    # Read through to the archive once the page runs past the oldest live entry
+    if limit and len(seltzers) < limit:
+        archived = seltzers_archive_collection.find(page_filter).sort(sort).limit(limit - len(seltzers))
+        for seltzer in archived:
+            seltzer['archived'] = True
+            seltzers.append(seltzer)
+        seltzers.sort(key=lambda seltzer: (seltzer[SELTZER_TIME_FIELD], seltzer['_id']), reverse=True)
     
-    return jsonify(seltzers)
+    return jsonify([serialize_seltzer(seltzer) for seltzer in seltzers])
 
 @app.route('/api/seltzers/<seltzer_id>', methods=['GET'])
 @login_required
 def get_seltzer(seltzer_id):
     """Get a single seltzer entry"""
     seltzer = seltzers_collection.find_one({'_id': ObjectId(seltzer_id), 'user_id': current_user.id})
+    if seltzer:
+        return jsonify(serialize_seltzer(seltzer))
+    
+    seltzer = seltzers_archive_collection.find_one({'_id': ObjectId(seltzer_id), 'user_id': current_user.id})
     if not seltzer:
         return jsonify({'error': 'Seltzer not found'}), 404
     
-    seltzer['_id'] = str(seltzer['_id'])
-    seltzer['created_at'] = seltzer['created_at'].isoformat()
-    
-    return jsonify(seltzer)
+    return jsonify(serialize_seltzer(seltzer, archived=True))
 
 @app.route('/api/seltzers', methods=['POST'])
 @login_required
 def create_seltzer():
     """Create a new seltzer entry"""
     data = request.get_json()
+    now = datetime.utcnow()
     
     seltzer_data = {
         'user_id': current_user.id,
@@ -265,14 +458,15 @@ def create_seltzer():
         'date': data.get('date'),
         'time': data.get('time'),
         'notes': data.get('notes', ''),
-        'created_at': datetime.utcnow()
+        'consumed_at': parse_consumed_at(data.get('date'), data.get('time'), now),
+        'created_at': now
     }
     
     result = seltzers_collection.insert_one(seltzer_data)
-    seltzer_data['_id'] = str(result.inserted_id)
-    seltzer_data['created_at'] = seltzer_data['created_at'].isoformat()
+    seltzer_data['_id'] = result.inserted_id
+    record_ratings([rating_sketch_update(seltzer_data['brand'], seltzer_data['flavor'], seltzer_data['rating'], 1)])
     
-    return jsonify(seltzer_data)
+    return jsonify(serialize_seltzer(seltzer_data))
 
 @app.route('/api/seltzers/<seltzer_id>', methods=['PUT'])
 @login_required
@@ -294,14 +488,20 @@ def update_seltzer(seltzer_id):
         'date': data.get('date'),
         'time': data.get('time'),
         'notes': data.get('notes', ''),
+        'consumed_at': parse_consumed_at(data.get('date'), data.get('time'), seltzer.get('created_at')),
         'updated_at': datetime.utcnow()
     }
     
     seltzers_collection.update_one(
-        {'_id': ObjectId(seltzer_id)},
+        {'_id': ObjectId(seltzer_id), 'user_id': current_user.id},
         {'$set': update_data}
     )
     
+    old_rating = (seltzer.get('brand'), seltzer.get('flavor'), seltzer.get('rating', 0))
+    new_rating = (update_data['brand'], update_data['flavor'], update_data['rating'])
+    if old_rating != new_rating:
+        record_ratings([rating_sketch_update(*old_rating, -1), rating_sketch_update(*new_rating, 1)])
+    
     return jsonify({'success': True})
 
 @app.route('/api/seltzers/<seltzer_id>', methods=['DELETE'])
@@ -313,7 +513,8 @@ def delete_seltzer(seltzer_id):
     if not seltzer:
         return jsonify({'success': False, 'message': 'Seltzer not found'})
     
-    seltzers_collection.delete_one({'_id': ObjectId(seltzer_id)})
+    seltzers_collection.delete_one({'_id': ObjectId(seltzer_id), 'user_id': current_user.id})
+    record_ratings([rating_sketch_update(seltzer.get('brand'), seltzer.get('flavor'), seltzer.get('rating', 0), -1)])
     return jsonify({'success': True})
 
 @app.route('/api/brands', methods=['GET'])
@@ -324,7 +525,10 @@ def get_brands():
     for brand in brands:
         brand['_id'] = str(brand['_id'])
     
-    return jsonify(brands)
+    # Clients can revalidate with If-None-Match until the catalog changes
+    response = jsonify(brands)
+    response.set_etag(str(catalog_version()))
+    return response.make_conditional(request)
 
 @app.route('/api/brands/<brand_id>/flavors', methods=['POST'])
 @login_required
@@ -339,19 +543,16 @@ def add_flavor(brand_id):
     if not flavor_name:
         return jsonify({'success': False, 'message': 'Flavor name is required'})
     
-    # Check if flavor already exists
-    brand = brands_collection.find_one({'id': brand_id})
-    if not brand:
-        return jsonify({'success': False, 'message': 'Brand not found'})
-    
-    if flavor_name in brand['flavors']:
-        return jsonify({'success': False, 'message': 'Flavor already exists'})
-    
-    brands_collection.update_one(
+    result = brands_collection.update_one(
         {'id': brand_id},
-        {'$push': {'flavors': flavor_name}}
+        {'$addToSet': {'flavors': flavor_name}}
     )
+    if not result.matched_count:
+        return jsonify({'success': False, 'message': 'Brand not found'})
+    if not result.modified_count:
+        return jsonify({'success': False, 'message': 'Flavor already exists'})
     
+    bump_catalog_version()
     return jsonify({'success': True})
 
 @app.route('/api/brands/<brand_id>/flavors', methods=['DELETE'])
@@ -367,13 +568,19 @@ def remove_flavor(brand_id):
     if not flavor_name:
         return jsonify({'success': False, 'message': 'Flavor name is required'})
     
-    brands_collection.update_one(
+    result = brands_collection.update_one(
         {'id': brand_id},
         {'$pull': {'flavors': flavor_name}}
     )
+    if result.modified_count:
+        bump_catalog_version()
     
     return jsonify({'success': True})
 
+def brand_id_from_name(brand_name):
+    """Generate a brand id from its name (lowercase, spaces to hyphens)"""
+    return brand_name.lower().replace(' ', '-').replace('&', 'and')
+
 @app.route('/api/brands', methods=['POST'])
 @login_required
 def create_brand():
@@ -390,25 +597,174 @@ def create_brand():
         return jsonify({'success': False, 'message': 'Brand name is required'})
     
     if not brand_id:
-        # Generate brand_id from brand_name (lowercase, replace spaces with hyphens)
-        brand_id = brand_name.lower().replace(' ', '-').replace('&', 'and')
+        brand_id = brand_id_from_name(brand_name)
     
-    # Check if brand already exists
-    if brands_collection.find_one({'$or': [{'name': brand_name}, {'id': brand_id}]}):
+    # Without the unique indexes (duplicates already in the data), check first
+    if not brand_indexes_unique() and brands_collection.find_one({'$or': [{'name': brand_name}, {'id': brand_id}]}):
         return jsonify({'success': False, 'message': 'Brand with this name or ID already exists'})
     
-    # Create new brand
+    # Create new brand; the unique indexes reject duplicate names and ids
     brand_data = {
         'name': brand_name,
         'id': brand_id,
         'flavors': initial_flavors if initial_flavors else []
     }
     
-    result = brands_collection.insert_one(brand_data)
+    try:
+        result = brands_collection.insert_one(brand_data)
+    except DuplicateKeyError:
+        return jsonify({'success': False, 'message': 'Brand with this name or ID already exists'})
     brand_data['_id'] = str(result.inserted_id)
+    bump_catalog_version()
     
     return jsonify({'success': True, 'brand': brand_data})
 
+def text_field(operation, field, required_message=None):
+    """Return a stripped string field of a batch operation, raising ValueError if it's invalid or missing"""
+    value = operation.get(field)
+    if value is None:
+        value = ''
+    if not isinstance(value, str):
+        raise ValueError(f'{field} must be a string')
+    value = value.strip()
+    if required_message and not value:
+        raise ValueError(required_message)
+    return value
+
+def name_list(operation, field):
+    """Return a list field of a batch operation, raising ValueError unless it holds non-empty strings"""
+    value = operation.get(field)
+    if value is None:
+        return []
+    if not isinstance(value, list) or not all(isinstance(name, str) and name.strip() for name in value):
+        raise ValueError(f'{field} must be a list of non-empty names')
+    return [name.strip() for name in value]
+
+def catalog_operation(operation):
+    """Parse one batch catalog operation into (brand_id, new_name, write).
+
+    new_name is the name the operation gives the brand, or None if it keeps its
+    name; write is the bulk write request that applies the operation.
+    """
+    if not isinstance(operation, dict):
+        raise ValueError('Each operation must be an object')
+    op = operation.get('op')
+    
+    if op == 'create_brand':
+        brand_name = text_field(operation, 'brand_name', 'Brand name is required')
+        brand_id = text_field(operation, 'brand_id') or brand_id_from_name(brand_name)
+        return brand_id, brand_name, InsertOne({
+            'name': brand_name,
+            'id': brand_id,
+            'flavors': name_list(operation, 'initial_flavors')
+        })
+    
+    brand_id = text_field(operation, 'brand_id', 'Brand ID is required')
+    
+    if op in ('add_flavors', 'remove_flavors'):
+        flavors = name_list(operation, 'flavors')
+        flavor_name = text_field(operation, 'flavor_name')
+        if not flavors and flavor_name:
+            flavors = [flavor_name]
+        if not flavors:
+            raise ValueError('At least one flavor name is required')
+        if op == 'add_flavors':
+            return brand_id, None, UpdateOne({'id': brand_id}, {'$addToSet': {'flavors': {'$each': flavors}}})
+        return brand_id, None, UpdateOne({'id': brand_id}, {'$pull': {'flavors': {'$in': flavors}}})
+    
+    if op == 'rename':
+        brand_name = text_field(operation, 'brand_name', 'New brand name is required')
+        return brand_id, brand_name, UpdateOne({'id': brand_id}, {'$set': {'name': brand_name}})
+    
+    raise ValueError(f'Unknown operation: {op}')
+
+def check_batch_brands(parsed):
+    """Return (index, message) for the first operation on a missing brand, or one creating a duplicate
+    when the unique brand indexes are missing; None if the batch can be written.
+
+    parsed is the list of (brand_id, new_name, write) tuples from catalog_operation.
+    """
+    ids = [brand_id for brand_id, _, _ in parsed]
+    names = [name for _, name, _ in parsed]
+    brands = {
+        brand['id']: brand['name']
+        for brand in brands_collection.find(
+            {'$or': [{'id': {'$in': ids}}, {'name': {'$in': [name for name in names if name]}}]},
+            {'id': 1, 'name': 1}
+        )
+    }
+    check_duplicates = not brand_indexes_unique()
+    
+    # Walk the batch in order, so brands created earlier in it count as existing
+    for index, (brand_id, name, write) in enumerate(parsed):
+        if isinstance(write, InsertOne):
+            if check_duplicates and (brand_id in brands or name in brands.values()):
+                return index, 'Brand with this name or ID already exists'
+        elif brand_id not in brands:
+            return index, 'Brand not found'
+        elif check_duplicates and name and name != brands[brand_id] and name in brands.values():
+            return index, 'Brand with this name or ID already exists'
+        if name:
+            brands[brand_id] = name
+    return None
+
+@app.route('/api/brands/batch', methods=['POST'])
+@login_required
+def batch_brands():
+    """Apply a list of catalog operations in one ordered bulk write (admin only)"""
+    if not is_admin():
+        return jsonify({'success': False, 'message': 'Admin privileges required'})
+    
+    data = request.get_json(silent=True)
+    operations = data.get('operations') if isinstance(data, dict) else None
+    if not isinstance(operations, list):
+        return jsonify({'success': False, 'message': 'operations must be a list'})
+    if not operations:
+        return jsonify({'success': False, 'message': 'No operations given'})
+    
+    # Validate everything before writing anything
+    parsed = []
+    for index, operation in enumerate(operations):
+        try:
+            parsed.append(catalog_operation(operation))
+        except ValueError as e:
+            return jsonify({'success': False, 'message': str(e), 'index': index})
+    problem = check_batch_brands(parsed)
+    if problem:
+        index, message = problem
+        return jsonify({'success': False, 'message': message, 'index': index})
+    
+    # Ordered, so a failure stops the batch and the operations after it are not applied
+    writes = [write for _, _, write in parsed]
+    try:
+        result = brands_collection.bulk_write(writes, ordered=True)
+    except BulkWriteError as e:
+        error = e.details['writeErrors'][0]
+        applied = error['index']
+        message = 'Brand with this name or ID already exists' if error['code'] == 11000 else error['errmsg']
+        version = bump_catalog_version() if applied else catalog_version()
+        return jsonify({
+            'success': False,
+            'message': message,
+            'index': applied,
+            'applied': applied,
+            'catalog_version': version
+        })
+    
+    changed = result.inserted_count or result.modified_count
+    response = {
+        'success': True,
+        'inserted': result.inserted_count,
+        'matched': result.matched_count,
+        'modified': result.modified_count,
+        'catalog_version': bump_catalog_version() if changed else catalog_version()
+    }
+    # A brand deleted after the check above leaves its updates unmatched
+    unmatched = sum(isinstance(write, UpdateOne) for write in writes) - result.matched_count
+    if unmatched:
+        response.update({'success': False, 'message': 'Brand not found', 'unmatched': unmatched})
+    return jsonify(response)
+
 @app.route('/api/brands/<brand_id>', methods=['DELETE'])
 @login_required
 def delete_brand(brand_id):
@@ -421,13 +777,14 @@ def delete_brand(brand_id):
     if not brand:
         return jsonify({'success': False, 'message': 'Brand not found'})
     
-    # Check if brand is being used in any seltzer entries
-    seltzer_count = seltzers_collection.count_documents({'brand_id': brand_id})
+    # Check if brand is being used in any seltzer entries (across all users)
+    seltzer_count = seltzers_collection.untargeted().count_documents({'brand_id': brand_id})
     if seltzer_count > 0:
         return jsonify({'success': False, 'message': f'Cannot delete brand. It is being used in {seltzer_count} seltzer entries.'})
     
     # Delete the brand
     brands_collection.delete_one({'id': brand_id})
+    bump_catalog_version()
     
     return jsonify({'success': True, 'message': f'Brand "{brand["name"]}" deleted successfully'})
 
@@ -435,41 +792,39 @@ def delete_brand(brand_id):
 @login_required
 def get_user_stats():
     """Get user statistics"""
-    # Get total seltzers
-    total_seltzers = seltzers_collection.count_documents({'user_id': current_user.id})
-    
-    # Get average rating
+    # Per-brand totals for live entries
     pipeline = [
         {'$match': {'user_id': current_user.id}},
-        {'$group': {'_id': None, 'avg_rating': {'$avg': '$rating'}}}
+        {'$group': {'_id': '$brand', 'count': {'$sum': 1}, 'rating_sum': {'$sum': '$rating'}}}
     ]
-    avg_rating_result = list(seltzers_collection.aggregate(pipeline))
-    avg_rating = round(avg_rating_result[0]['avg_rating'], 1) if avg_rating_result else 0
+    brand_totals = {}
+    for row in seltzers_collection.aggregate(pipeline):
+        brand_totals[row['_id']] = [row['count'], row['rating_sum']]
+    
+    # Fold in the totals of archived entries
+    for rollup in seltzer_rollups_collection.find({'user_id': current_user.id}):
+        totals = brand_totals.setdefault(rollup['brand'], [0, 0])
+        totals[0] += rollup['count']
+        totals[1] += rollup['rating_sum']
+    
+    total_seltzers = sum(count for count, _ in brand_totals.values())
+    rating_sum = sum(rating for _, rating in brand_totals.values())
+    avg_rating = round(rating_sum / total_seltzers, 1) if total_seltzers else 0
     
     # Get this week's count
     week_ago = datetime.utcnow() - timedelta(days=7)
     this_week = seltzers_collection.count_documents({
         'user_id': current_user.id,
-        'created_at': {'$gte': week_ago}
+        SELTZER_TIME_FIELD: {'$gte': week_ago}
     })
     
-    # Get top brand
-    pipeline = [
-        {'$match': {'user_id': current_user.id}},
-        {'$group': {'_id': '$brand', 'count': {'$sum': 1}}},
-        {'$sort': {'count': -1}},
-        {'$limit': 1}
-    ]
-    top_brand_result = list(seltzers_collection.aggregate(pipeline))
-    top_brand = top_brand_result[0]['_id'] if top_brand_result else 'None'
-    
-    # Get brand distribution
-    brand_pipeline = [
-        {'$match': {'user_id': current_user.id}},
-        {'$group': {'_id': '$brand', 'count': {'$sum': 1}}},
-        {'$sort': {'count': -1}}
-    ]
-    brand_distribution = list(seltzers_collection.aggregate(brand_pipeline))
+    # Get brand distribution and top brand
+    brand_distribution = sorted(
+        ({'_id': brand, 'count': count} for brand, (count, _) in brand_totals.items()),
+        key=lambda row: row['count'],
+        reverse=True
+    )
+    top_brand = brand_distribution[0]['_id'] if brand_distribution else 'None'
     
     return jsonify({
         'total_seltzers': total_seltzers,
@@ -500,14 +855,55 @@ def search_seltzers():
                 {'notes': {'$regex': query, '$options': 'i'}}
             ]
     
-    seltzers = list(seltzers_collection.find(search_filter).sort('created_at', -1))
-    
-    for seltzer in seltzers:
-        seltzer['_id'] = str(seltzer['_id'])
-        seltzer['created_at'] = seltzer['created_at'].isoformat()
+    seltzers = [serialize_seltzer(seltzer) for seltzer in seltzers_collection.find(search_filter).sort(SELTZER_TIME_FIELD, -1)]
     
     return jsonify(seltzers)
 
+@app.route('/api/analytics/ratings', methods=['GET'])
+@login_required
+def get_rating_analytics():
+    """Rating distribution and percentiles by brand and flavor across all users"""
+    brand = request.args.get('brand')
+    flavor = request.args.get('flavor')
+    
+    # Only the unfiltered sketches are cached, so arbitrary filters can't grow the cache
+    cached = _rating_analytics_cache.get('histograms')
+    if cached and time.monotonic() - cached[0] < RATING_ANALYTICS_TTL:
+        all_histograms = cached[1]
+    else:
+        all_histograms = {}
+        for sketch in rating_sketches_collection.find():
+            histogram = to_histogram(sketch.get('counts'))
+            if histogram:
+                all_histograms.setdefault(sketch['brand'], {})[sketch['flavor']] = histogram
+        _rating_analytics_cache['histograms'] = (time.monotonic(), all_histograms)
+    
+    histograms = {}
+    for brand_name, flavors in all_histograms.items():
+        if brand and brand_name != brand:
+            continue
+        matching = {name: histogram for name, histogram in flavors.items() if not flavor or name == flavor}
+        if matching:
+            histograms[brand_name] = matching
+    
+    brands = []
+    for brand_name, flavors in histograms.items():
+        brands.append({
+            'brand': brand_name,
+            **summarize(merge_histograms(flavors.values())),
+            'flavors': sorted(
+                ({'flavor': flavor_name, **summarize(histogram)} for flavor_name, histogram in flavors.items()),
+                key=lambda row: row['count'],
+                reverse=True
+            )
+        })
+    brands.sort(key=lambda row: row['count'], reverse=True)
+    
+    return jsonify({
+        'overall': summarize(merge_histograms(h for flavors in histograms.values() for h in flavors.values())),
+        'brands': brands
+    })
+
 # Serve static files
 @app.route('/<path:filename>')
 def serve_static(filename):
@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+"""
+Archive old seltzer entries out of the live seltzers collection
+"""
+
+import argparse
+import gzip
+import os
+import sys
+from datetime import datetime, timedelta
+
+from bson import json_util
+from pymongo import ASCENDING, DESCENDING, UpdateOne
+from pymongo.errors import BulkWriteError
+
+from app import (
+    ARCHIVE_AFTER_MONTHS,
+    SELTZER_TIME_FIELD,
+    get_db,
+    seltzer_ndjson_entries_collection,
+    seltzer_rollups_collection,
+    seltzers_archive_collection,
+    seltzers_collection,
+)
+
+def ensure_archive_collection():
+    """Create the archive collection with zstd block compression and its read-through index"""
+    db = get_db()
+    if seltzers_archive_collection.name not in db.list_collection_names():
+        db.create_collection(
+            seltzers_archive_collection.name,
+            storageEngine={'wiredTiger': {'configString': 'block_compressor=zstd'}}
+        )
+    seltzers_archive_collection.create_index([('user_id', ASCENDING), (SELTZER_TIME_FIELD, DESCENDING)])
+
+def ensure_rollup_indexes():
+    """Index the rollups and the record of entries written to NDJSON"""
+    seltzer_rollups_collection.create_index([('user_id', ASCENDING), ('brand', ASCENDING), ('tier', ASCENDING)], unique=True)
+    seltzer_ndjson_entries_collection.create_index([('user_id', ASCENDING), ('brand', ASCENDING)])
+
+# Rollups are kept per tier and recomputed from what that tier holds: the
+# archive collection itself, or the record of entries written to NDJSON files.
+# Re-running an interrupted batch therefore can't count an entry twice.
+
+def refresh_rollups(tier, source, user_ids):
+    """Recompute one tier's per-user/brand totals for these users from its source collection"""
+    pipeline = [
+        {'$match': {'user_id': {'$in': list(user_ids)}}},
+        {'$group': {
+            '_id': {'user_id': '$user_id', 'brand': '$brand'},
+            'count': {'$sum': 1},
+            'rating_sum': {'$sum': '$rating'}
+        }}
+    ]
+    operations = [
+        UpdateOne(
+            {'user_id': row['_id']['user_id'], 'brand': row['_id'].get('brand'), 'tier': tier},
+            {'$set': {'count': row['count'], 'rating_sum': row['rating_sum']}},
+            upsert=True
+        )
+        for row in source.aggregate(pipeline)
+    ]
+    if operations:
+        seltzer_rollups_collection.bulk_write(operations, ordered=False)
+
+def insert_ignoring_duplicates(collection, documents):
+    """Insert documents, ignoring ones an interrupted run already inserted"""
+    try:
+        collection.insert_many(documents, ordered=False)
+    except BulkWriteError as e:
+        # 11000 is a duplicate _id, i.e. the document is already there
+        if any(error['code'] != 11000 for error in e.details['writeErrors']):
+            raise
+
+def write_to_collection(entries):
+    """Copy entries into the archive collection and refresh its rollups"""
+    insert_ignoring_duplicates(seltzers_archive_collection, entries)
+    refresh_rollups('collection', seltzers_archive_collection, {entry['user_id'] for entry in entries})
+
+def write_to_ndjson(entries, directory):
+    """Write entries not yet in an NDJSON file to gzipped files per month, record them and refresh their rollups.
+
+    Files are named after the first and last _id they hold and overwritten, so
+    an interrupted batch re-runs into the same files.
+    """
+    user_ids = list({entry['user_id'] for entry in entries})
+    written = {
+        record['_id'] for record in seltzer_ndjson_entries_collection.find(
+            {'user_id': {'$in': user_ids}, '_id': {'$in': [entry['_id'] for entry in entries]}}, {'_id': 1}
+        )
+    }
+    entries = [entry for entry in entries if entry['_id'] not in written]
+
+    os.makedirs(directory, exist_ok=True)
+    by_month = {}
+    for entry in entries:
+        by_month.setdefault(entry[SELTZER_TIME_FIELD].strftime('%Y-%m'), []).append(entry)
+    records = []
+    for month, month_entries in by_month.items():
+        path = os.path.join(directory, f"seltzers-{month}-{month_entries[0]['_id']}-{month_entries[-1]['_id']}.ndjson.gz")
+        with gzip.open(path, 'wt', encoding='utf-8') as f:
+            for entry in month_entries:
+                f.write(json_util.dumps(entry) + '\n')
+        records.extend(
+            {'_id': entry['_id'], 'user_id': entry['user_id'], 'brand': entry.get('brand'),
+             'rating': entry.get('rating', 0), 'file': os.path.basename(path)}
+            for entry in month_entries
+        )
+
+    # Recorded only once the files are complete, so a crash before this rewrites them
+    if records:
+        insert_ignoring_duplicates(seltzer_ndjson_entries_collection, records)
+    refresh_rollups('ndjson', seltzer_ndjson_entries_collection, user_ids)
+
+def archive(cutoff, target='collection', directory='archive', batch_size=1000, dry_run=False):
+    """Move entries older than cutoff to the archive, folding them into the rollups first.
+
+    Each batch is written to the archive, folded into the rollups, then deleted
+    from the live collection, so an interrupted run leaves every entry readable.
+    Until the job is re-run, an interrupted batch is counted in both the live
+    entries and the rollups; the re-run archives it once and corrects the rollups.
+    """
+    if not dry_run:
+        ensure_rollup_indexes()
+        if target == 'collection':
+            ensure_archive_collection()
+
+    query = {SELTZER_TIME_FIELD: {'$lt': cutoff}}
+    if dry_run:
+        return seltzers_collection.untargeted().count_documents(query)
+
+    archived = 0
+    while True:
+        # Archival sweeps every user, so it deliberately scatters across shards
+        entries = list(seltzers_collection.untargeted().find(query).sort(SELTZER_TIME_FIELD, ASCENDING).limit(batch_size))
+        if not entries:
+            break
+        if target == 'collection':
+            write_to_collection(entries)
+        else:
+            write_to_ndjson(entries, directory)
+        seltzers_collection.delete_many({
+            'user_id': {'$in': list({entry['user_id'] for entry in entries})},
+            '_id': {'$in': [entry['_id'] for entry in entries]}
+        })
+        archived += len(entries)
+    return archived
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip())
+    parser.add_argument('--months', type=int, default=ARCHIVE_AFTER_MONTHS,
+                        help='archive entries older than this many months')
+    parser.add_argument('--to', dest='target', choices=['collection', 'ndjson'], default='collection',
+                        help='compressed archive collection (read through by the API) or gzipped NDJSON files')
+    parser.add_argument('--dir', dest='directory', default='archive', help='output directory for --to ndjson')
+    parser.add_argument('--batch-size', type=int, default=1000)
+    parser.add_argument('--dry-run', action='store_true', help='count entries without moving them')
+    args = parser.parse_args()
+
+    cutoff = datetime.utcnow() - timedelta(days=30 * args.months)
+    print(f"🔄 Archiving entries from before {cutoff:%Y-%m-%d} to {args.target}...")
+    try:
+        archived = archive(cutoff, args.target, args.directory, args.batch_size, args.dry_run)
+    except Exception as e:
+        print(f"❌ Archival failed: {e}")
+        sys.exit(1)
+
+    verb = 'Would archive' if args.dry_run else 'Archived'
+    print(f"✅ {verb} {archived} entries")
+
+if __name__ == "__main__":
+    main()
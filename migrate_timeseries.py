@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+"""
+Migrate seltzer entries into a MongoDB time-series collection
+"""
+
+import argparse
+import sys
+
+from app import TIMESERIES_OPTIONS, ensure_timeseries_collection, get_db, parse_consumed_at
+
+def to_timeseries_doc(seltzer):
+    """Give a legacy seltzer entry the real consumed-at timestamp the time-series collection needs"""
+    if 'consumed_at' not in seltzer:
+        seltzer['consumed_at'] = parse_consumed_at(
+            seltzer.get('date'), seltzer.get('time'), seltzer.get('created_at')
+        )
+    return seltzer
+
+def already_copied(db, target, batch):
+    """Return the ids in batch that an earlier run already copied into target.
+
+    Time-series collections have no unique _id index, so duplicates can't be
+    caught on insert; the user_id and consumed_at bounds let the lookup use the
+    collection's (metaField, timeField) index.
+    """
+    found = db[target].find({
+        'user_id': {'$in': list({doc.get('user_id') for doc in batch})},
+        'consumed_at': {
+            '$gte': min(doc['consumed_at'] for doc in batch),
+            '$lte': max(doc['consumed_at'] for doc in batch)
+        },
+        '_id': {'$in': [doc['_id'] for doc in batch]}
+    }, {'_id': 1})
+    return {doc['_id'] for doc in found}
+
+def migrate(db, source, target, batch_size=1000, dry_run=False):
+    """Copy every entry from source into the target time-series collection.
+
+    Entries already copied by an earlier run are skipped, so the tool can be
+    re-run safely; a dry run reports what a real run would copy and skip.
+    """
+    if not dry_run:
+        ensure_timeseries_collection(db, target)
+
+    copied = 0
+    skipped = 0
+
+    def flush(batch):
+        nonlocal copied, skipped
+        existing = already_copied(db, target, batch)
+        new_docs = [doc for doc in batch if doc['_id'] not in existing]
+        if new_docs and not dry_run:
+            db[target].insert_many(new_docs)
+        copied += len(new_docs)
+        skipped += len(existing)
+
+    batch = []
+    for seltzer in db[source].find().sort('_id', 1):
+        doc = to_timeseries_doc(seltzer)
+        if doc['consumed_at'] is None:
+            print(f"⚠️  Skipping {doc['_id']}: no usable date or created_at")
+            skipped += 1
+            continue
+        batch.append(doc)
+        if len(batch) >= batch_size:
+            flush(batch)
+            batch = []
+    if batch:
+        flush(batch)
+
+    return copied, skipped
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip())
+    parser.add_argument('--source', default='seltzers', help='plain collection to read from')
+    parser.add_argument('--target', default='seltzers_ts', help='time-series collection to write to')
+    parser.add_argument('--batch-size', type=int, default=1000)
+    parser.add_argument('--dry-run', action='store_true', help='count entries without writing')
+    args = parser.parse_args()
+
+    db = get_db()
+
+    print(f"🔄 Migrating '{args.source}' -> '{args.target}' "
+          f"(timeField={TIMESERIES_OPTIONS['timeField']}, metaField={TIMESERIES_OPTIONS['metaField']})")
+    try:
+        copied, skipped = migrate(db, args.source, args.target, args.batch_size, args.dry_run)
+    except Exception as e:
+        print(f"❌ Migration failed: {e}")
+        sys.exit(1)
+
+    verb = 'Would copy' if args.dry_run else 'Copied'
+    print(f"✅ {verb} {copied} entries ({skipped} skipped)")
+    if not args.dry_run:
+        print("\n📋 Next steps:")
+        print("1. Set SELTZER_STORAGE_MODE=timeseries in .env")
+        print(f"2. Set SELTZERS_COLLECTION={args.target} if you used a custom target")
+        print("3. Restart the application")
+
+if __name__ == "__main__":
+    main()
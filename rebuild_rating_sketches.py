@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+"""
+Rebuild the per-brand/flavor rating sketches from every live and archived seltzer entry
+
+Entries archived to NDJSON files (archive_seltzers.py --to ndjson) can't be
+queried, so they are left out of the rebuilt sketches.
+"""
+
+import sys
+
+from pymongo import UpdateOne
+
+from app import (
+    rating_sketches_collection,
+    seltzer_rollups_collection,
+    seltzers_archive_collection,
+    seltzers_collection,
+)
+
+def rating_counts():
+    """Count entries per brand, flavor and rating across all users"""
+    pipeline = [
+        {'$group': {
+            '_id': {'brand': '$brand', 'flavor': '$flavor', 'rating': '$rating'},
+            'count': {'$sum': 1}
+        }}
+    ]
+    counts = {}
+    # Sketches cover every user, so this deliberately scatters across shards
+    for collection in (seltzers_collection, seltzers_archive_collection):
+        for row in collection.untargeted().aggregate(pipeline):
+            key = (row['_id'].get('brand'), row['_id'].get('flavor'))
+            rating = str(row['_id'].get('rating') or 0)
+            sketch = counts.setdefault(key, {})
+            sketch[rating] = sketch.get(rating, 0) + row['count']
+    return counts
+
+def ndjson_archived_entries():
+    """Number of entries archived to NDJSON files, which a rebuild can't count"""
+    pipeline = [
+        {'$match': {'tier': 'ndjson'}},
+        {'$group': {'_id': None, 'count': {'$sum': '$count'}}}
+    ]
+    rows = list(seltzer_rollups_collection.untargeted().aggregate(pipeline))
+    return rows[0]['count'] if rows else 0
+
+def rebuild():
+    """Replace every sketch with counts recomputed from the entries"""
+    counts = rating_counts()
+    rating_sketches_collection.delete_many({})
+    operations = [
+        UpdateOne({'brand': brand, 'flavor': flavor}, {'$set': {'counts': sketch}}, upsert=True)
+        for (brand, flavor), sketch in counts.items()
+    ]
+    if operations:
+        rating_sketches_collection.bulk_write(operations, ordered=False)
+    return len(operations)
+
+def main():
+    print("🔄 Rebuilding rating sketches (pause writes for exact counts)...")
+    try:
+        skipped = ndjson_archived_entries()
+        rebuilt = rebuild()
+    except Exception as e:
+        print(f"❌ Rebuild failed: {e}")
+        sys.exit(1)
+    print(f"✅ Rebuilt {rebuilt} brand/flavor sketches")
+    if skipped:
+        print(f"⚠️  {skipped} entries archived to NDJSON files are not included in the sketches")
+
+if __name__ == "__main__":
+    main()
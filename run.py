@@ -3,17 +3,22 @@
 Run script for SeltzerTracker Flask application
 """
 
+import argparse
 import os
 import sys
 import subprocess
+import time
 
 def check_mongodb():
     """Check if MongoDB is running"""
     try:
-        import pymongo
-        from pymongo import MongoClient
-        client = MongoClient('mongodb://localhost:27017/')
-        client.admin.command('ping')
+        # Reuse the app's client so the server doesn't open a second connection pool
+        from app import storage
+        from storage import MongoStorage
+        if not isinstance(storage, MongoStorage):
+            print("ℹ️  Using the in-memory storage backend, MongoDB not checked")
+            return True
+        storage.ping()
         print("✅ MongoDB is running")
         return True
     except Exception as e:
@@ -45,7 +50,48 @@ def check_env_file():
         print("   Then edit .env with your MongoDB credentials")
         return False
 
+def profile_startup():
+    """Report how long importing the app and serving its first requests take"""
+    print("⏱️  Profiling SeltzerTracker startup")
+    print("=" * 50)
+
+    start = time.perf_counter()
+    from app import app, storage
+    import_time = time.perf_counter() - start
+    print(f"Import app.py:            {import_time * 1000:8.1f} ms")
+
+    client = app.test_client()
+    start = time.perf_counter()
+    client.get('/')
+    first_request = time.perf_counter() - start
+    print(f"First request (GET /):    {first_request * 1000:8.1f} ms")
+
+    from storage import MongoStorage
+    if isinstance(storage, MongoStorage):
+        start = time.perf_counter()
+        try:
+            storage.ping()
+        except Exception as e:
+            print(f"MongoDB connect + ping:   failed ({e.__class__.__name__})")
+            return
+        print(f"MongoDB connect + ping:   {(time.perf_counter() - start) * 1000:8.1f} ms")
+    else:
+        print("MongoDB connect + ping:   skipped (in-memory storage backend)")
+
+    start = time.perf_counter()
+    client.get('/api/brands')
+    print(f"First DB request:         {(time.perf_counter() - start) * 1000:8.1f} ms")
+
 def main():
+    parser = argparse.ArgumentParser(description="Run the SeltzerTracker Flask application")
+    parser.add_argument('--profile-startup', action='store_true',
+                        help='report import time and time to first request, then exit')
+    args = parser.parse_args()
+
+    if args.profile_startup:
+        profile_startup()
+        return
+
     print("🚀 Starting SeltzerTracker Flask Application")
     print("=" * 50)
     
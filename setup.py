@@ -51,11 +51,13 @@ def main():
     # Check if MongoDB is running (optional)
     print("🔍 Checking MongoDB connection...")
     try:
-        import pymongo
-        from pymongo import MongoClient
-        client = MongoClient('mongodb://localhost:27017/')
-        client.admin.command('ping')
-        print("✅ MongoDB is running and accessible")
+        from app import storage
+        from storage import MongoStorage
+        if isinstance(storage, MongoStorage):
+            storage.ping()
+            print("✅ MongoDB is running and accessible")
+        else:
+            print("ℹ️  Using the in-memory storage backend, MongoDB not checked")
     except Exception as e:
         print(f"⚠️  MongoDB connection failed: {e}")
         print("   Please make sure MongoDB is installed and running:")
@@ -0,0 +1,298 @@
+#!/usr/bin/env python3
+"""
+Simulate SeltzerTracker on a hash-sharded cluster and report how many shards each operation touches
+"""
+
+import argparse
+import hashlib
+from collections import defaultdict
+from contextlib import contextmanager
+
+from pymongo.operations import DeleteMany, DeleteOne, InsertOne, ReplaceOne, UpdateMany, UpdateOne
+from pymongo.results import BulkWriteResult, DeleteResult, InsertManyResult, UpdateResult
+from werkzeug.security import generate_password_hash
+
+from sharding import SHARD_KEY
+from storage import MemoryCursor, MemoryDatabase, run_pipeline
+
+SHARDED_COLLECTIONS = ('seltzers', 'seltzers_ts', 'seltzers_archive', 'seltzer_rollups', 'seltzer_ndjson_entries')
+
+def shard_key_values(filter, shard_key=SHARD_KEY):
+    """Return the set of shard key values a filter pins, or None if it isn't targeted"""
+    if not isinstance(filter, dict):
+        return None
+    if shard_key in filter:
+        condition = filter[shard_key]
+        if not isinstance(condition, dict):
+            return {condition}
+        if '$eq' in condition:
+            return {condition['$eq']}
+        if '$in' in condition:
+            return set(condition['$in'])
+    for sub in filter.get('$and', []):
+        values = shard_key_values(sub, shard_key)
+        if values is not None:
+            return values
+    if filter.get('$or'):
+        branches = [shard_key_values(sub, shard_key) for sub in filter['$or']]
+        if all(values is not None for values in branches):
+            return set().union(*branches)
+    return None
+
+class ShardedMemoryStorage:
+    """Storage backend that spreads per-user collections over several in-memory shards.
+
+    Per-user collections are hash-sharded on user_id; everything else lives on
+    the first (primary) shard, as unsharded collections do on a real cluster.
+    Every routed operation is recorded in operations as (collection, op, shards touched).
+    """
+    def __init__(self, num_shards):
+        self.shards = [MemoryDatabase(f'shard{index}') for index in range(num_shards)]
+        self.operations = []
+        self._database = ShardedDatabase(self)
+
+    def database(self):
+        return self._database
+
+    def ping(self):
+        pass
+
+    def shard_for(self, value):
+        digest = hashlib.md5(repr(value).encode()).digest()
+        return int.from_bytes(digest[:8], 'big') % len(self.shards)
+
+class ShardedDatabase:
+    def __init__(self, storage):
+        self.storage = storage
+        self._collections = {}
+
+    def __getitem__(self, name):
+        if name not in SHARDED_COLLECTIONS:
+            return self.storage.shards[0][name]
+        if name not in self._collections:
+            self._collections[name] = ShardedCollection(self.storage, name)
+        return self._collections[name]
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        return self[name]
+
+    def list_collection_names(self):
+        return sorted(set().union(*(shard.list_collection_names() for shard in self.storage.shards)))
+
+    def list_collections(self, filter=None):
+        return self.storage.shards[0].list_collections(filter)
+
+    def create_collection(self, name, **options):
+        shards = self.storage.shards if name in SHARDED_COLLECTIONS else self.storage.shards[:1]
+        for shard in shards:
+            shard.create_collection(name, **options)
+        return self[name]
+
+    def command(self, command, *args, **kwargs):
+        return self.storage.shards[0].command(command, *args, **kwargs)
+
+class ShardedCollection:
+    """Routes operations to the shards owning the user_id values they target"""
+    def __init__(self, storage, name):
+        self.storage = storage
+        self.name = name
+
+    def _route(self, op, filter):
+        values = shard_key_values(filter)
+        if values is None:
+            indexes = range(len(self.storage.shards))
+        else:
+            indexes = sorted({self.storage.shard_for(value) for value in values})
+        self.storage.operations.append((self.name, op, len(indexes)))
+        return [self.storage.shards[index][self.name] for index in indexes]
+
+    def _shard_for_document(self, op, document):
+        index = self.storage.shard_for(document.get(SHARD_KEY))
+        self.storage.operations.append((self.name, op, 1))
+        return self.storage.shards[index][self.name]
+
+    # Reads
+
+    def find(self, filter=None, projection=None):
+        results = []
+        for shard in self._route('find', filter):
+            results.extend(shard.find(filter, projection))
+        return MemoryCursor(results)
+
+    def find_one(self, filter=None, projection=None):
+        return next(self.find(filter, projection).limit(1), None)
+
+    def count_documents(self, filter):
+        return sum(shard.count_documents(filter) for shard in self._route('count_documents', filter))
+
+    def distinct(self, key, filter=None):
+        values = []
+        for shard in self._route('distinct', filter):
+            values.extend(value for value in shard.distinct(key, filter) if value not in values)
+        return values
+
+    def aggregate(self, pipeline):
+        # Each shard runs the leading $match; the router merges and runs the rest
+        first_match = pipeline[0]['$match'] if pipeline and '$match' in pipeline[0] else {}
+        docs = []
+        for shard in self._route('aggregate', first_match):
+            docs.extend(shard.find(first_match))
+        return iter(run_pipeline(docs, pipeline[1:] if first_match else pipeline))
+
+    # Writes
+
+    def insert_one(self, document):
+        return self._shard_for_document('insert_one', document).insert_one(document)
+
+    def insert_many(self, documents, ordered=True):
+        ids = [self.insert_one(document).inserted_id for document in documents]
+        return InsertManyResult(ids, True)
+
+    def _write_one(self, op, filter, *args, **kwargs):
+        # Without the shard key, mongos has to try every shard until one matches
+        result = None
+        for shard in self._route(op, filter):
+            result = getattr(shard, op)(filter, *args, **kwargs)
+            if getattr(result, 'matched_count', 0) or getattr(result, 'deleted_count', 0):
+                return result
+        return result
+
+    def update_one(self, filter, update, upsert=False):
+        result = self._write_one('update_one', filter, update)
+        if result.matched_count or not upsert:
+            return result
+        return self._shard_for_document('update_one', filter).update_one(filter, update, upsert=True)
+
+    def replace_one(self, filter, replacement, upsert=False):
+        return self._write_one('replace_one', filter, replacement, upsert=upsert)
+
+    def delete_one(self, filter):
+        return self._write_one('delete_one', filter)
+
+    def update_many(self, filter, update, upsert=False):
+        raw = {'n': 0, 'nModified': 0, 'ok': 1.0}
+        for shard in self._route('update_many', filter):
+            result = shard.update_many(filter, update, upsert=upsert)
+            raw['n'] += result.matched_count
+            raw['nModified'] += result.modified_count
+        return UpdateResult(raw, True)
+
+    def delete_many(self, filter):
+        deleted = sum(shard.delete_many(filter).deleted_count for shard in self._route('delete_many', filter))
+        return DeleteResult({'n': deleted, 'ok': 1.0}, True)
+
+    def bulk_write(self, requests, ordered=True):
+        result = {'writeErrors': [], 'writeConcernErrors': [], 'nInserted': 0, 'nUpserted': 0,
+                  'nMatched': 0, 'nModified': 0, 'nRemoved': 0, 'upserted': []}
+        for index, request in enumerate(requests):
+            if isinstance(request, InsertOne):
+                self.insert_one(request._doc)
+                result['nInserted'] += 1
+            elif isinstance(request, (UpdateOne, ReplaceOne)):
+                method = self.update_one if isinstance(request, UpdateOne) else self.replace_one
+                outcome = method(request._filter, request._doc, upsert=bool(request._upsert))
+                if outcome.upserted_id is not None:
+                    result['nUpserted'] += 1
+                    result['upserted'].append({'index': index, '_id': outcome.upserted_id})
+                result['nMatched'] += outcome.matched_count
+                result['nModified'] += outcome.modified_count
+            elif isinstance(request, UpdateMany):
+                outcome = self.update_many(request._filter, request._doc)
+                result['nMatched'] += outcome.matched_count
+                result['nModified'] += outcome.modified_count
+            elif isinstance(request, (DeleteOne, DeleteMany)):
+                method = self.delete_one if isinstance(request, DeleteOne) else self.delete_many
+                result['nRemoved'] += method(request._filter).deleted_count
+        return BulkWriteResult(result, True)
+
+    def create_index(self, keys, **kwargs):
+        name = None
+        for shard in self.storage.shards:
+            name = shard[self.name].create_index(keys, **kwargs)
+        return name
+
+    def documents_per_shard(self):
+        return [len(list(shard[self.name].find())) for shard in self.storage.shards]
+
+@contextmanager
+def sharded_app(num_shards):
+    """Point app.py at a fresh sharded storage, rejecting untargeted operations"""
+    import app as app_module
+
+    storage = ShardedMemoryStorage(num_shards)
+    sharded = [app_module.seltzers_collection, app_module.seltzers_archive_collection,
+               app_module.seltzer_rollups_collection, app_module.seltzer_ndjson_entries_collection]
+    saved = (app_module.storage, app_module.generate_password_hash, [c.mode for c in sharded])
+
+    app_module.storage = storage
+    # Full-strength password hashing would dominate the run for thousands of users
+    app_module.generate_password_hash = lambda password: generate_password_hash(password, method='pbkdf2:sha256:1000')
+    for collection in sharded:
+        collection.mode = 'reject'
+    try:
+        app_module.init_default_data()
+        yield app_module.app, storage
+    finally:
+        app_module.storage, app_module.generate_password_hash, modes = saved
+        for collection, mode in zip(sharded, modes):
+            collection.mode = mode
+
+def run_user_workload(client, username, entries_per_user):
+    """Register a user and exercise every per-user seltzer route"""
+    client.post('/register', json={'username': username, 'email': f'{username}@example.com', 'password': 'pw'})
+    ids = []
+    for index in range(entries_per_user):
+        created = client.post('/api/seltzers', json={
+            'brand': 'LaCroix', 'brand_id': 'lacroix', 'flavor': 'Lime', 'rating': index % 5 + 1,
+            'date': '2025-10-01', 'time': '12:00'
+        }).get_json()
+        ids.append(created['_id'])
+    client.get('/api/seltzers')
+    client.get('/api/seltzers?limit=3')
+    client.get(f'/api/seltzers/{ids[0]}')
+    client.put(f'/api/seltzers/{ids[0]}', json={'brand': 'Bubly', 'flavor': 'Cherry', 'rating': 5})
+    client.get('/api/stats')
+    client.get('/api/search?q=lime')
+    client.delete(f'/api/seltzers/{ids[-1]}')
+
+def simulate(num_shards, num_users, entries_per_user=5):
+    """Run the per-user workload for num_users users and summarize shard fan-out per operation"""
+    import app as app_module
+
+    with sharded_app(num_shards) as (app, storage):
+        app.config['TESTING'] = True
+        for user in range(num_users):
+            with app.test_client() as client:
+                run_user_workload(client, f'user{user}', entries_per_user)
+
+        summary = defaultdict(lambda: {'count': 0, 'single_shard': 0, 'max_shards': 0})
+        for collection, op, shards in storage.operations:
+            row = summary[(collection, op)]
+            row['count'] += 1
+            row['single_shard'] += shards == 1
+            row['max_shards'] = max(row['max_shards'], shards)
+        seltzers = storage.database()[app_module.SELTZERS_COLLECTION]
+        return dict(summary), seltzers.documents_per_shard()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip())
+    parser.add_argument('--shards', type=int, default=4)
+    parser.add_argument('--users', type=int, nargs='+', default=[10, 100, 1000])
+    parser.add_argument('--entries', type=int, default=5, help='entries logged per user')
+    args = parser.parse_args()
+
+    print(f"🧪 Simulating {args.shards} shards, sharded on hashed {SHARD_KEY}")
+    for num_users in args.users:
+        summary, per_shard = simulate(args.shards, num_users, args.entries)
+        print(f"\n👥 {num_users} users, entries per shard: {per_shard}")
+        print(f"   {'operation':<36}{'count':>8}{'single-shard':>14}{'max shards':>12}")
+        for (collection, op), row in sorted(summary.items()):
+            print(f"   {collection + '.' + op:<36}{row['count']:>8}{row['single_shard']:>14}{row['max_shards']:>12}")
+        untargeted = sum(row['count'] - row['single_shard'] for row in summary.values())
+        status = "✅" if untargeted == 0 else "⚠️ "
+        print(f"{status} {untargeted} operations touched more than one shard")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,162 @@
+"""
+Shard-key-aware access to per-user collections
+
+Seltzer entries, their archive and rollups are all owned by one user, so on a
+sharded cluster they would be sharded on user_id. An operation whose filter
+doesn't pin user_id has to be broadcast to every shard (scatter-gather).
+ShardKeyCollection checks every filter, pipeline and inserted document for the
+shard key and either rejects or logs operations that would not be targeted.
+"""
+
+import logging
+
+from pymongo.operations import DeleteMany, DeleteOne, InsertOne, ReplaceOne, UpdateMany, UpdateOne
+
+SHARD_KEY = 'user_id'
+
+# Index and collection management calls that don't take a filter, passed straight through
+PASSTHROUGH_ATTRIBUTES = frozenset({
+    'create_index', 'create_indexes', 'drop_index', 'drop_indexes', 'index_information',
+    'list_indexes', 'drop', 'full_name', 'database', 'options', 'estimated_document_count',
+})
+
+logger = logging.getLogger(__name__)
+
+class UntargetedQueryError(Exception):
+    """Raised when an operation on a sharded collection doesn't include the shard key"""
+
+def targets_shard_key(filter, shard_key=SHARD_KEY):
+    """Return True if filter pins the shard key to one value or a fixed set of values"""
+    if not isinstance(filter, dict):
+        return False
+    if shard_key in filter:
+        condition = filter[shard_key]
+        if not isinstance(condition, dict):
+            return True
+        return '$eq' in condition or '$in' in condition
+    if '$and' in filter and any(targets_shard_key(sub, shard_key) for sub in filter['$and']):
+        return True
+    if '$or' in filter and filter['$or']:
+        return all(targets_shard_key(sub, shard_key) for sub in filter['$or'])
+    return False
+
+def pipeline_targets_shard_key(pipeline, shard_key=SHARD_KEY):
+    """Return True if the pipeline starts with a $match that targets the shard key"""
+    return bool(pipeline) and '$match' in pipeline[0] and targets_shard_key(pipeline[0]['$match'], shard_key)
+
+class ShardKeyCollection:
+    """Collection wrapper that requires the shard key on every operation.
+
+    mode is 'reject' (raise UntargetedQueryError), 'warn' (log and run the
+    operation anyway) or 'off'. Deliberate cross-user operations, like admin
+    checks and maintenance jobs, go through untargeted().
+    """
+    def __init__(self, collection, shard_key=SHARD_KEY, mode='warn'):
+        self._collection = collection
+        self.shard_key = shard_key
+        self.mode = mode
+
+    @property
+    def name(self):
+        return self._collection.name
+
+    def untargeted(self):
+        """Return the underlying collection for intentional scatter-gather operations"""
+        return self._collection
+
+    def _check(self, targeted, operation, detail):
+        if targeted or self.mode == 'off':
+            return
+        message = f"{operation} on '{self.name}' without shard key '{self.shard_key}': {detail!r}"
+        if self.mode == 'reject':
+            raise UntargetedQueryError(message)
+        logger.warning(message)
+
+    def _check_filter(self, operation, filter):
+        self._check(targets_shard_key(filter, self.shard_key), operation, filter)
+
+    def _check_document(self, operation, document):
+        self._check(self.shard_key in document, operation, document)
+
+    # Reads
+
+    def find(self, filter=None, *args, **kwargs):
+        self._check_filter('find', filter)
+        return self._collection.find(filter, *args, **kwargs)
+
+    def find_one(self, filter=None, *args, **kwargs):
+        self._check_filter('find_one', filter)
+        return self._collection.find_one(filter, *args, **kwargs)
+
+    def count_documents(self, filter, *args, **kwargs):
+        self._check_filter('count_documents', filter)
+        return self._collection.count_documents(filter, *args, **kwargs)
+
+    def distinct(self, key, filter=None, *args, **kwargs):
+        self._check_filter('distinct', filter)
+        return self._collection.distinct(key, filter, *args, **kwargs)
+
+    def aggregate(self, pipeline, *args, **kwargs):
+        self._check(pipeline_targets_shard_key(pipeline, self.shard_key), 'aggregate', pipeline[:1])
+        return self._collection.aggregate(pipeline, *args, **kwargs)
+
+    # Writes
+
+    def insert_one(self, document, *args, **kwargs):
+        self._check_document('insert_one', document)
+        return self._collection.insert_one(document, *args, **kwargs)
+
+    def insert_many(self, documents, *args, **kwargs):
+        documents = list(documents)
+        for document in documents:
+            self._check_document('insert_many', document)
+        return self._collection.insert_many(documents, *args, **kwargs)
+
+    def update_one(self, filter, update, *args, **kwargs):
+        self._check_filter('update_one', filter)
+        return self._collection.update_one(filter, update, *args, **kwargs)
+
+    def update_many(self, filter, update, *args, **kwargs):
+        self._check_filter('update_many', filter)
+        return self._collection.update_many(filter, update, *args, **kwargs)
+
+    def replace_one(self, filter, replacement, *args, **kwargs):
+        self._check_filter('replace_one', filter)
+        return self._collection.replace_one(filter, replacement, *args, **kwargs)
+
+    def delete_one(self, filter, *args, **kwargs):
+        self._check_filter('delete_one', filter)
+        return self._collection.delete_one(filter, *args, **kwargs)
+
+    def delete_many(self, filter, *args, **kwargs):
+        self._check_filter('delete_many', filter)
+        return self._collection.delete_many(filter, *args, **kwargs)
+
+    def find_one_and_update(self, filter, update, *args, **kwargs):
+        self._check_filter('find_one_and_update', filter)
+        return self._collection.find_one_and_update(filter, update, *args, **kwargs)
+
+    def find_one_and_replace(self, filter, replacement, *args, **kwargs):
+        self._check_filter('find_one_and_replace', filter)
+        return self._collection.find_one_and_replace(filter, replacement, *args, **kwargs)
+
+    def find_one_and_delete(self, filter, *args, **kwargs):
+        self._check_filter('find_one_and_delete', filter)
+        return self._collection.find_one_and_delete(filter, *args, **kwargs)
+
+    def bulk_write(self, requests, *args, **kwargs):
+        requests = list(requests)
+        for request in requests:
+            if isinstance(request, InsertOne):
+                self._check_document('bulk_write insert', request._doc)
+            elif isinstance(request, (UpdateOne, UpdateMany, ReplaceOne, DeleteOne, DeleteMany)):
+                self._check_filter(f'bulk_write {type(request).__name__}', request._filter)
+        return self._collection.bulk_write(requests, *args, **kwargs)
+
+    def __getattr__(self, attr):
+        # Anything else that reads or writes documents must be wrapped above, or go through untargeted()
+        if attr not in PASSTHROUGH_ATTRIBUTES:
+            raise AttributeError(
+                f"'{type(self).__name__}' has no shard-key-checked '{attr}'; use untargeted() for unchecked access"
+            )
+        return getattr(self._collection, attr)
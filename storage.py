@@ -0,0 +1,675 @@
+"""
+Storage backends for SeltzerTracker
+
+The routes talk to collections through the subset of the pymongo API they use.
+MongoStorage hands out real pymongo collections; MemoryStorage hands out
+in-memory collections with the same query, update, sort, aggregate and unique
+index semantics, for tests and local benchmarking without a MongoDB server.
+"""
+
+import contextlib
+import copy
+import functools
+import re
+import threading
+
+from bson import ObjectId
+from pymongo import MongoClient
+from pymongo.errors import BulkWriteError, CollectionInvalid, DuplicateKeyError
+from pymongo.operations import DeleteMany, DeleteOne, InsertOne, ReplaceOne, UpdateMany, UpdateOne
+from pymongo.results import BulkWriteResult, DeleteResult, InsertManyResult, InsertOneResult, UpdateResult
+
+class MongoStorage:
+    """Storage backed by a MongoDB server, connecting on first use"""
+    def __init__(self, uri, database_name):
+        self.uri = uri
+        self.database_name = database_name
+        self._client = None
+        self._lock = threading.Lock()
+
+    @property
+    def client(self):
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    self._client = MongoClient(self.uri)
+        return self._client
+
+    def database(self):
+        return self.client[self.database_name]
+
+    def ping(self):
+        self.client.admin.command('ping')
+
+class MemoryStorage:
+    """Storage kept in process memory; nothing is persisted"""
+    def __init__(self):
+        self._database = MemoryDatabase()
+
+    def database(self):
+        return self._database
+
+    def ping(self):
+        pass
+
+_NO_LOCK = contextlib.nullcontext()
+
+# Query matching
+
+_MISSING = object()
+
+def _get_path(doc, path):
+    """Look up a dotted field path, returning _MISSING if it isn't there"""
+    value = doc
+    for part in path.split('.'):
+        if isinstance(value, dict) and part in value:
+            value = value[part]
+        else:
+            return _MISSING
+    return value
+
+def _set_path(doc, path, value):
+    parts = path.split('.')
+    for part in parts[:-1]:
+        doc = doc.setdefault(part, {})
+    doc[parts[-1]] = value
+
+def _unset_path(doc, path):
+    parts = path.split('.')
+    for part in parts[:-1]:
+        doc = doc.get(part)
+        if not isinstance(doc, dict):
+            return
+    doc.pop(parts[-1], None)
+
+def _is_operator_dict(value):
+    return isinstance(value, dict) and value and all(key.startswith('$') for key in value)
+
+def _equals(value, expected):
+    if value is _MISSING:
+        return expected is None
+    if isinstance(value, list) and not isinstance(expected, list):
+        return expected in value
+    return value == expected
+
+def _compare(value, op, arg):
+    if value is _MISSING or value is None:
+        return False
+    candidates = value if isinstance(value, list) else [value]
+    for candidate in candidates:
+        try:
+            if op == '$gt' and candidate > arg:
+                return True
+            if op == '$gte' and candidate >= arg:
+                return True
+            if op == '$lt' and candidate < arg:
+                return True
+            if op == '$lte' and candidate <= arg:
+                return True
+        except TypeError:
+            continue
+    return False
+
+def _regex_matches(value, pattern, options):
+    flags = re.IGNORECASE if 'i' in options else 0
+    candidates = value if isinstance(value, list) else [value]
+    return any(isinstance(candidate, str) and re.search(pattern, candidate, flags) for candidate in candidates)
+
+def _match_field(value, condition):
+    if not _is_operator_dict(condition):
+        return _equals(value, condition)
+    for op, arg in condition.items():
+        if op == '$options':
+            continue
+        if op in ('$gt', '$gte', '$lt', '$lte'):
+            matched = _compare(value, op, arg)
+        elif op == '$eq':
+            matched = _equals(value, arg)
+        elif op == '$ne':
+            matched = not _equals(value, arg)
+        elif op == '$in':
+            matched = any(_equals(value, item) for item in arg)
+        elif op == '$nin':
+            matched = not any(_equals(value, item) for item in arg)
+        elif op == '$exists':
+            matched = (value is not _MISSING) == bool(arg)
+        elif op == '$regex':
+            matched = _regex_matches(value, arg, condition.get('$options', ''))
+        else:
+            raise NotImplementedError(f"Query operator {op} is not supported by MemoryStorage")
+        if not matched:
+            return False
+    return True
+
+def matches(doc, query):
+    """Return True if doc satisfies a MongoDB query document"""
+    for key, condition in (query or {}).items():
+        if key == '$or':
+            if not any(matches(doc, sub) for sub in condition):
+                return False
+        elif key == '$and':
+            if not all(matches(doc, sub) for sub in condition):
+                return False
+        elif key == '$nor':
+            if any(matches(doc, sub) for sub in condition):
+                return False
+        elif not _match_field(_get_path(doc, key), condition):
+            return False
+    return True
+
+# Sorting
+
+def _sort_key(value):
+    # MongoDB orders missing and null values before everything else
+    if value is _MISSING or value is None:
+        return (0, 0)
+    return (1, value)
+
+def _normalize_sort(key_or_list, direction=None):
+    if isinstance(key_or_list, str):
+        return [(key_or_list, direction if direction is not None else 1)]
+    return list(key_or_list.items()) if isinstance(key_or_list, dict) else list(key_or_list)
+
+def sort_documents(docs, spec):
+    """Sort docs in place by a list of (field, direction) pairs"""
+    for field, direction in reversed(spec):
+        docs.sort(key=lambda doc: _sort_key(_get_path(doc, field)), reverse=direction == -1)
+    return docs
+
+# Updates
+
+def _apply_update(doc, update):
+    if not _is_operator_dict(update):
+        # Replacement document
+        _id = doc['_id']
+        doc.clear()
+        doc.update(copy.deepcopy(update))
+        doc['_id'] = _id
+        return
+    for op, fields in update.items():
+        for path, arg in fields.items():
+            current = _get_path(doc, path)
+            if op == '$set':
+                _set_path(doc, path, copy.deepcopy(arg))
+            elif op == '$unset':
+                _unset_path(doc, path)
+            elif op == '$inc':
+                _set_path(doc, path, (0 if current is _MISSING else current) + arg)
+            elif op in ('$push', '$addToSet'):
+                items = arg['$each'] if isinstance(arg, dict) and '$each' in arg else [arg]
+                array = [] if current is _MISSING else current
+                for item in items:
+                    if op == '$push' or item not in array:
+                        array.append(copy.deepcopy(item))
+                _set_path(doc, path, array)
+            elif op == '$pull':
+                if isinstance(current, list):
+                    if _is_operator_dict(arg):
+                        kept = [item for item in current if not _match_field(item, arg)]
+                    else:
+                        kept = [item for item in current if item != arg]
+                    _set_path(doc, path, kept)
+            elif op == '$setOnInsert':
+                pass
+            else:
+                raise NotImplementedError(f"Update operator {op} is not supported by MemoryStorage")
+
+def _upsert_seed(query, update):
+    """Build the document an upsert inserts from the query's equality fields"""
+    doc = {}
+    for key, condition in query.items():
+        if not key.startswith('$') and not _is_operator_dict(condition):
+            _set_path(doc, key, copy.deepcopy(condition))
+    if _is_operator_dict(update):
+        for path, value in update.get('$setOnInsert', {}).items():
+            _set_path(doc, path, copy.deepcopy(value))
+    return doc
+
+# Aggregation
+
+def _evaluate(doc, expression):
+    if isinstance(expression, str) and expression.startswith('$'):
+        value = _get_path(doc, expression[1:])
+        return None if value is _MISSING else value
+    if isinstance(expression, dict):
+        return {key: _evaluate(doc, sub) for key, sub in expression.items()}
+    return expression
+
+def _accumulate(docs, accumulator):
+    (op, expression), = accumulator.items()
+    values = [_evaluate(doc, expression) for doc in docs]
+    numbers = [value for value in values if isinstance(value, (int, float)) and not isinstance(value, bool)]
+    if op == '$sum':
+        return sum(numbers)
+    if op == '$avg':
+        return sum(numbers) / len(numbers) if numbers else None
+    if op == '$min':
+        present = [value for value in values if value is not None]
+        return min(present) if present else None
+    if op == '$max':
+        present = [value for value in values if value is not None]
+        return max(present) if present else None
+    if op == '$push':
+        return values
+    if op == '$addToSet':
+        unique = []
+        for value in values:
+            if value not in unique:
+                unique.append(value)
+        return unique
+    if op == '$first':
+        return values[0] if values else None
+    if op == '$last':
+        return values[-1] if values else None
+    raise NotImplementedError(f"Accumulator {op} is not supported by MemoryStorage")
+
+def _group(docs, spec):
+    groups = {}
+    keys = {}
+    for doc in docs:
+        key = _evaluate(doc, spec['_id'])
+        hashable = repr(key)
+        keys.setdefault(hashable, key)
+        groups.setdefault(hashable, []).append(doc)
+    results = []
+    for hashable, group_docs in groups.items():
+        result = {'_id': keys[hashable]}
+        for field, accumulator in spec.items():
+            if field != '_id':
+                result[field] = _accumulate(group_docs, accumulator)
+        results.append(result)
+    return results
+
+def _project(doc, spec):
+    include = [field for field, value in spec.items() if value and field != '_id']
+    if include:
+        projected = {}
+        for field in include:
+            value = spec[field]
+            if isinstance(value, (str, dict)):
+                projected[field] = _evaluate(doc, value)
+            else:
+                found = _get_path(doc, field)
+                if found is not _MISSING:
+                    _set_path(projected, field, found)
+        if spec.get('_id', 1) and '_id' in doc:
+            projected['_id'] = doc['_id']
+        return projected
+    projected = copy.deepcopy(doc)
+    for field, value in spec.items():
+        if not value:
+            _unset_path(projected, field)
+    return projected
+
+def run_pipeline(docs, pipeline):
+    """Run the aggregation stages the app uses over a list of documents"""
+    for stage in pipeline:
+        (name, spec), = stage.items()
+        if name == '$match':
+            docs = [doc for doc in docs if matches(doc, spec)]
+        elif name == '$group':
+            docs = _group(docs, spec)
+        elif name == '$sort':
+            docs = sort_documents(list(docs), _normalize_sort(spec))
+        elif name == '$limit':
+            docs = docs[:spec]
+        elif name == '$skip':
+            docs = docs[spec:]
+        elif name == '$project':
+            docs = [_project(doc, spec) for doc in docs]
+        elif name == '$unwind':
+            path = spec if isinstance(spec, str) else spec['path']
+            field = path[1:]
+            unwound = []
+            for doc in docs:
+                for item in _get_path(doc, field) if isinstance(_get_path(doc, field), list) else []:
+                    copied = copy.deepcopy(doc)
+                    _set_path(copied, field, item)
+                    unwound.append(copied)
+            docs = unwound
+        elif name == '$count':
+            docs = [{spec: len(docs)}] if docs else []
+        else:
+            raise NotImplementedError(f"Aggregation stage {name} is not supported by MemoryStorage")
+    return docs
+
+# Collections
+
+def _locked(method):
+    """Run a collection method while holding its database's lock"""
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self.database._lock:
+            return method(self, *args, **kwargs)
+    return wrapper
+
+class MemoryCursor:
+    """Lazy cursor supporting sort, skip and limit"""
+    def __init__(self, docs, projection=None, lock=None):
+        self._docs = docs
+        self._projection = projection
+        self._lock = lock
+        self._sort = []
+        self._skip = 0
+        self._limit = 0
+        self._iterator = None
+
+    def sort(self, key_or_list, direction=None):
+        self._sort = _normalize_sort(key_or_list, direction)
+        return self
+
+    def skip(self, count):
+        self._skip = count
+        return self
+
+    def limit(self, count):
+        self._limit = count
+        return self
+
+    def _results(self):
+        # Copy the page while holding the lock, so concurrent writes can't change it mid-copy
+        with self._lock or _NO_LOCK:
+            docs = sort_documents(list(self._docs), self._sort)[self._skip:]
+            if self._limit:
+                docs = docs[:self._limit]
+            docs = [copy.deepcopy(doc) for doc in docs]
+        for doc in docs:
+            yield _project(doc, self._projection) if self._projection else doc
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if self._iterator is None:
+            self._iterator = self._results()
+        return next(self._iterator)
+
+class MemoryCollection:
+    """In-memory stand-in for a pymongo Collection.
+
+    Every read and write holds the database's lock, so the app can serve
+    requests on several threads with this backend.
+    """
+    def __init__(self, database, name, options=None):
+        self.database = database
+        self.name = name
+        self.options = options or {}
+        self._docs = []
+        # Unique indexes: name -> fields, and name -> {key: document}
+        self._unique_indexes = {'_id_': ('_id',)}
+        self._index_entries = {'_id_': {}}
+        self._indexes = {'_id_': [('_id', 1)]}
+
+    # Indexes
+
+    @_locked
+    def create_index(self, keys, unique=False, name=None, **kwargs):
+        spec = _normalize_sort(keys, 1)
+        name = name or '_'.join(f"{field}_{direction}" for field, direction in spec)
+        if unique and name not in self._unique_indexes:
+            fields = tuple(field for field, _ in spec)
+            entries = {}
+            for doc in self._docs:
+                key = self._index_key(doc, fields)
+                if key in entries:
+                    raise DuplicateKeyError(f"E11000 duplicate key error index: {name} dup key: {key}", 11000)
+                entries[key] = doc
+            self._unique_indexes[name] = fields
+            self._index_entries[name] = entries
+        self._indexes.setdefault(name, spec)
+        self.database._touch(self.name)
+        return name
+
+    @_locked
+    def index_information(self):
+        info = {}
+        for name, spec in self._indexes.items():
+            info[name] = {'key': spec}
+            if name in self._unique_indexes:
+                info[name]['unique'] = True
+        return info
+
+    @staticmethod
+    def _index_key(doc, fields):
+        # Unique indexes treat a missing field as null
+        values = (_get_path(doc, field) for field in fields)
+        return tuple(repr(None if value is _MISSING else value) for value in values)
+
+    def _check_unique(self, candidate, ignore=None):
+        for name, fields in self._unique_indexes.items():
+            key = self._index_key(candidate, fields)
+            existing = self._index_entries[name].get(key)
+            if existing is not None and existing is not ignore:
+                raise DuplicateKeyError(f"E11000 duplicate key error index: {name} dup key: {key}", 11000)
+
+    def _index(self, doc):
+        for name, fields in self._unique_indexes.items():
+            self._index_entries[name][self._index_key(doc, fields)] = doc
+
+    def _unindex(self, doc):
+        for name, fields in self._unique_indexes.items():
+            self._index_entries[name].pop(self._index_key(doc, fields), None)
+
+    # Reads
+
+    @_locked
+    def find(self, filter=None, projection=None):
+        return MemoryCursor([doc for doc in self._docs if matches(doc, filter)], projection, self.database._lock)
+
+    def find_one(self, filter=None, projection=None):
+        if filter is not None and not isinstance(filter, dict):
+            filter = {'_id': filter}
+        return next(self.find(filter, projection).limit(1), None)
+
+    @_locked
+    def count_documents(self, filter):
+        return sum(1 for doc in self._docs if matches(doc, filter))
+
+    @_locked
+    def distinct(self, key, filter=None):
+        values = []
+        for doc in self._docs:
+            if matches(doc, filter):
+                value = _get_path(doc, key)
+                for item in value if isinstance(value, list) else [value]:
+                    if item is not _MISSING and item not in values:
+                        values.append(item)
+        return values
+
+    @_locked
+    def aggregate(self, pipeline):
+        return iter(run_pipeline([copy.deepcopy(doc) for doc in self._docs], pipeline))
+
+    # Writes
+
+    def _insert(self, document):
+        if '_id' not in document:
+            document['_id'] = ObjectId()
+        stored = copy.deepcopy(document)
+        self._check_unique(stored)
+        self._docs.append(stored)
+        self._index(stored)
+        self.database._touch(self.name)
+        return stored['_id']
+
+    @_locked
+    def insert_one(self, document):
+        return InsertOneResult(self._insert(document), True)
+
+    @_locked
+    def insert_many(self, documents, ordered=True):
+        ids = []
+        errors = []
+        for index, document in enumerate(documents):
+            try:
+                ids.append(self._insert(document))
+            except DuplicateKeyError as e:
+                errors.append({'index': index, 'code': 11000, 'errmsg': str(e), 'op': document})
+                if ordered:
+                    break
+        if errors:
+            raise BulkWriteError({'writeErrors': errors, 'writeConcernErrors': [], 'nInserted': len(ids),
+                                  'nUpserted': 0, 'nMatched': 0, 'nModified': 0, 'nRemoved': 0, 'upserted': []})
+        return InsertManyResult(ids, True)
+
+    def _update(self, filter, update, upsert, multi):
+        targets = [doc for doc in self._docs if matches(doc, filter)]
+        if not multi:
+            targets = targets[:1]
+        modified = 0
+        for doc in targets:
+            updated = copy.deepcopy(doc)
+            _apply_update(updated, update)
+            if updated != doc:
+                self._check_unique(updated, ignore=doc)
+                self._unindex(doc)
+                doc.clear()
+                doc.update(updated)
+                self._index(doc)
+                modified += 1
+        raw = {'n': len(targets), 'nModified': modified, 'ok': 1.0}
+        if not targets and upsert:
+            doc = _upsert_seed(filter, update)
+            if _is_operator_dict(update):
+                _apply_update(doc, update)
+            else:
+                doc.update(copy.deepcopy(update))
+            raw['upserted'] = self._insert(doc)
+            raw['n'] = 1
+        return raw
+
+    @_locked
+    def update_one(self, filter, update, upsert=False):
+        return UpdateResult(self._update(filter, update, upsert, multi=False), True)
+
+    @_locked
+    def update_many(self, filter, update, upsert=False):
+        return UpdateResult(self._update(filter, update, upsert, multi=True), True)
+
+    @_locked
+    def replace_one(self, filter, replacement, upsert=False):
+        return UpdateResult(self._update(filter, replacement, upsert, multi=False), True)
+
+    @_locked
+    def find_one_and_update(self, filter, update, upsert=False, return_document=False):
+        """Update one document; return it as it was before, or after if return_document is True"""
+        before = self.find_one(filter)
+        raw = self._update(filter, update, upsert, multi=False)
+        if return_document:
+            _id = raw['upserted'] if 'upserted' in raw else before and before['_id']
+            return self.find_one({'_id': _id}) if _id is not None else None
+        return before
+
+    def _delete(self, filter, multi):
+        targets = [doc for doc in self._docs if matches(doc, filter)]
+        if not multi:
+            targets = targets[:1]
+        removed = {id(doc) for doc in targets}
+        for doc in targets:
+            self._unindex(doc)
+        self._docs = [doc for doc in self._docs if id(doc) not in removed]
+        return {'n': len(targets), 'ok': 1.0}
+
+    @_locked
+    def delete_one(self, filter):
+        return DeleteResult(self._delete(filter, multi=False), True)
+
+    @_locked
+    def delete_many(self, filter):
+        return DeleteResult(self._delete(filter, multi=True), True)
+
+    @_locked
+    def bulk_write(self, requests, ordered=True):
+        """Apply InsertOne/UpdateOne/UpdateMany/ReplaceOne/DeleteOne/DeleteMany requests"""
+        result = {'writeErrors': [], 'writeConcernErrors': [], 'nInserted': 0, 'nUpserted': 0,
+                  'nMatched': 0, 'nModified': 0, 'nRemoved': 0, 'upserted': []}
+        for index, request in enumerate(requests):
+            try:
+                if isinstance(request, InsertOne):
+                    self._insert(request._doc)
+                    result['nInserted'] += 1
+                elif isinstance(request, (UpdateOne, UpdateMany, ReplaceOne)):
+                    raw = self._update(request._filter, request._doc, request._upsert,
+                                       multi=isinstance(request, UpdateMany))
+                    if 'upserted' in raw:
+                        result['nUpserted'] += 1
+                        result['upserted'].append({'index': index, '_id': raw['upserted']})
+                    else:
+                        result['nMatched'] += raw['n']
+                        result['nModified'] += raw['nModified']
+                elif isinstance(request, (DeleteOne, DeleteMany)):
+                    raw = self._delete(request._filter, multi=isinstance(request, DeleteMany))
+                    result['nRemoved'] += raw['n']
+                else:
+                    raise TypeError(f"{request!r} is not a valid request")
+            except DuplicateKeyError as e:
+                result['writeErrors'].append({'index': index, 'code': 11000, 'errmsg': str(e), 'op': request})
+                if ordered:
+                    break
+        if result['writeErrors']:
+            raise BulkWriteError(result)
+        return BulkWriteResult(result, True)
+
+    @_locked
+    def drop(self):
+        self._docs = []
+        self._unique_indexes = {'_id_': ('_id',)}
+        self._index_entries = {'_id_': {}}
+        self._indexes = {'_id_': [('_id', 1)]}
+        self.database._drop(self.name)
+
+class MemoryDatabase:
+    """In-memory stand-in for a pymongo Database"""
+    def __init__(self, name='seltzertracker'):
+        self.name = name
+        self._collections = {}
+        self._existing = set()
+        # Reentrant, as collection methods call each other and the database
+        self._lock = threading.RLock()
+
+    def __getitem__(self, name):
+        with self._lock:
+            if name not in self._collections:
+                self._collections[name] = MemoryCollection(self, name)
+            return self._collections[name]
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        return self[name]
+
+    def _touch(self, name):
+        self._existing.add(name)
+
+    def _drop(self, name):
+        self._existing.discard(name)
+
+    def list_collection_names(self):
+        with self._lock:
+            return sorted(self._existing)
+
+    def list_collections(self, filter=None):
+        with self._lock:
+            infos = [
+                {
+                    'name': name,
+                    'type': 'timeseries' if 'timeseries' in self[name].options else 'collection',
+                    'options': self[name].options
+                }
+                for name in sorted(self._existing)
+            ]
+        return iter([info for info in infos if matches(info, filter)])
+
+    def create_collection(self, name, **options):
+        with self._lock:
+            if name in self._existing:
+                raise CollectionInvalid(f"collection {name} already exists")
+            collection = self[name]
+            collection.options = options
+            self._touch(name)
+            return collection
+
+    def command(self, command, *args, **kwargs):
+        if command == 'ping':
+            return {'ok': 1.0}
+        raise NotImplementedError(f"Command {command} is not supported by MemoryStorage")
@@ -0,0 +1,48 @@
+import os
+
+import pytest
+from werkzeug.security import generate_password_hash
+
+import app as app_module
+from storage import MemoryStorage
+
+@pytest.fixture
+def storage(monkeypatch):
+    """Fresh in-memory storage behind every collection in app.py"""
+    memory = MemoryStorage()
+    monkeypatch.setattr(app_module, 'storage', memory)
+    # Full-strength password hashing dominates test time otherwise
+    monkeypatch.setattr(app_module, 'generate_password_hash',
+                        lambda password: generate_password_hash(password, method='pbkdf2:sha256:1000'))
+    monkeypatch.setattr(app_module, '_rating_analytics_cache', {})
+    # Every per-user operation in the app must target the shard key
+    for collection in (app_module.seltzers_collection, app_module.seltzers_archive_collection,
+                       app_module.seltzer_rollups_collection, app_module.seltzer_ndjson_entries_collection):
+        monkeypatch.setattr(collection, 'mode', 'reject')
+    return memory
+
+@pytest.fixture
+def client(storage):
+    app_module.app.config['TESTING'] = True
+    app_module.init_default_data()
+    with app_module.app.test_client() as client:
+        yield client
+
+def register(client, username='testuser', email=None, password='testpassword123'):
+    return client.post('/register', json={
+        'username': username,
+        'email': email or f'{username}@example.com',
+        'password': password
+    })
+
+@pytest.fixture
+def user_client(client):
+    """Test client logged in as a freshly registered user"""
+    register(client)
+    return client
+
+@pytest.fixture
+def admin_client(user_client):
+    """Logged-in test client with admin access granted"""
+    user_client.post('/admin/verify', json={'password': os.getenv('ADMIN_PASSWORD', 'admin123')})
+    return user_client
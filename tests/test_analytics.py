@@ -0,0 +1,24 @@
+from collections import Counter
+
+from analytics import merge_histograms, percentile, summarize, to_histogram
+
+def test_to_histogram_drops_empty_buckets():
+    assert to_histogram({'4': 2, '5': 0}) == Counter({4: 2})
+    assert to_histogram(None) == Counter()
+
+def test_percentiles_are_nearest_rank():
+    histogram = Counter({1: 1, 3: 2, 5: 7})
+    assert percentile(histogram, 10) == 1
+    assert percentile(histogram, 25) == 3
+    assert percentile(histogram, 50) == 5
+    assert percentile(Counter(), 50) is None
+
+def test_merge_and_summarize():
+    merged = merge_histograms([Counter({4: 1}), Counter({4: 1, 2: 2})])
+    summary = summarize(merged)
+    assert summary['count'] == 4
+    assert summary['mean'] == 3.0
+    assert summary['distribution'] == {'2': 2, '4': 2}
+    assert summary['p50'] == 2
+    assert summary['p90'] == 4
+    assert summarize(Counter())['mean'] is None
@@ -0,0 +1,350 @@
+import os
+from datetime import datetime, timedelta
+
+import pytest
+from pymongo.errors import CollectionInvalid
+
+import app as app_module
+from conftest import register
+
+def log_seltzer(client, **overrides):
+    data = {
+        'brand': 'LaCroix',
+        'brand_id': 'lacroix',
+        'flavor': 'Lime',
+        'flavor_id': 'lime',
+        'rating': 4,
+        'date': '2025-10-01',
+        'time': '14:30',
+        'notes': 'crisp'
+    }
+    data.update(overrides)
+    return client.post('/api/seltzers', json=data).get_json()
+
+def test_index_shows_login_when_anonymous(client):
+    response = client.get('/')
+    assert response.status_code == 200
+    assert b'login' in response.data.lower()
+
+def test_register_login_logout(client):
+    assert register(client).get_json()['success']
+    assert not register(client).get_json()['success']
+
+    client.get('/logout')
+    response = client.post('/login', json={'username': 'testuser', 'password': 'wrong'})
+    assert not response.get_json()['success']
+    response = client.post('/login', json={'username': 'testuser', 'password': 'testpassword123'})
+    assert response.get_json()['success']
+
+def test_api_requires_login(client):
+    assert client.get('/api/seltzers').status_code == 302
+
+def test_brands_are_initialized(client):
+    brands = client.get('/api/brands').get_json()
+    assert len(brands) == 8
+    assert all(isinstance(brand['_id'], str) for brand in brands)
+
+def test_create_and_get_seltzer(user_client):
+    created = log_seltzer(user_client)
+    assert created['consumed_at'] == '2025-10-01T14:30:00'
+
+    fetched = user_client.get(f"/api/seltzers/{created['_id']}").get_json()
+    assert fetched['flavor'] == 'Lime'
+    assert fetched['rating'] == 4
+
+def test_seltzers_are_newest_first_and_limited(user_client):
+    for flavor in ['Lime', 'Lemon', 'Mango']:
+        log_seltzer(user_client, flavor=flavor)
+
+    seltzers = user_client.get('/api/seltzers').get_json()
+    assert [s['flavor'] for s in seltzers] == ['Mango', 'Lemon', 'Lime']
+    assert len(user_client.get('/api/seltzers?limit=2').get_json()) == 2
+
+def test_update_and_delete_seltzer(user_client):
+    created = log_seltzer(user_client)
+
+    response = user_client.put(f"/api/seltzers/{created['_id']}", json={
+        'brand': 'Bubly', 'brand_id': 'bubly', 'flavor': 'Cherry', 'rating': 5,
+        'date': '2025-10-02', 'time': '09:00'
+    })
+    assert response.get_json()['success']
+    updated = user_client.get(f"/api/seltzers/{created['_id']}").get_json()
+    assert updated['brand'] == 'Bubly'
+    assert updated['consumed_at'] == '2025-10-02T09:00:00'
+
+    assert user_client.delete(f"/api/seltzers/{created['_id']}").get_json()['success']
+    assert user_client.get(f"/api/seltzers/{created['_id']}").status_code == 404
+
+def test_users_cannot_see_each_others_seltzers(user_client):
+    created = log_seltzer(user_client)
+    user_client.get('/logout')
+    register(user_client, 'otheruser')
+
+    assert user_client.get('/api/seltzers').get_json() == []
+    assert user_client.get(f"/api/seltzers/{created['_id']}").status_code == 404
+    assert not user_client.delete(f"/api/seltzers/{created['_id']}").get_json()['success']
+
+def test_stats(user_client):
+    log_seltzer(user_client, rating=5)
+    log_seltzer(user_client, rating=3)
+    log_seltzer(user_client, brand='Bubly', rating=4)
+
+    stats = user_client.get('/api/stats').get_json()
+    assert stats['total_seltzers'] == 3
+    assert stats['avg_rating'] == 4.0
+    assert stats['this_week'] == 3
+    assert stats['top_brand'] == 'LaCroix'
+    assert stats['brand_distribution'] == [{'_id': 'LaCroix', 'count': 2}, {'_id': 'Bubly', 'count': 1}]
+
+def test_stats_include_archived_rollups(user_client):
+    log_seltzer(user_client, rating=2)
+    user_id = app_module.users_collection.find_one({'username': 'testuser'})['_id']
+    app_module.seltzer_rollups_collection.insert_one(
+        {'user_id': str(user_id), 'brand': 'Bubly', 'count': 3, 'rating_sum': 12}
+    )
+
+    stats = user_client.get('/api/stats').get_json()
+    assert stats['total_seltzers'] == 4
+    assert stats['avg_rating'] == 3.5
+    assert stats['top_brand'] == 'Bubly'
+
+def test_get_seltzers_reads_through_to_archive(user_client):
+    log_seltzer(user_client, flavor='Lime')
+    user_id = str(app_module.users_collection.find_one({'username': 'testuser'})['_id'])
+    app_module.seltzers_archive_collection.insert_one({
+        'user_id': user_id, 'brand': 'LaCroix', 'flavor': 'Coconut', 'rating': 3,
+        'date': '2023-01-01', 'time': '10:00', 'created_at': datetime.utcnow() - timedelta(days=800)
+    })
+
+    # Without a limit only live entries are returned; the archive is read past them
+    assert [s['flavor'] for s in user_client.get('/api/seltzers').get_json()] == ['Lime']
+    assert [s['flavor'] for s in user_client.get('/api/seltzers?limit=1').get_json()] == ['Lime']
+    seltzers = user_client.get('/api/seltzers?limit=2').get_json()
+    assert [s['flavor'] for s in seltzers] == ['Lime', 'Coconut']
+    assert seltzers[1]['archived']
+
+def test_get_seltzers_pages_with_before(user_client):
+    for flavor in ['Lime', 'Mango', 'Pear']:
+        log_seltzer(user_client, flavor=flavor)
+    user_id = str(app_module.users_collection.find_one({'username': 'testuser'})['_id'])
+    app_module.seltzers_archive_collection.insert_one({
+        'user_id': user_id, 'brand': 'LaCroix', 'flavor': 'Coconut', 'rating': 3,
+        'date': '2023-01-01', 'time': '10:00', 'created_at': datetime.utcnow() - timedelta(days=800)
+    })
+
+    first = user_client.get('/api/seltzers?limit=2').get_json()
+    assert [s['flavor'] for s in first] == ['Pear', 'Mango']
+    second = user_client.get(f"/api/seltzers?limit=2&before={first[-1]['_id']}").get_json()
+    assert [s['flavor'] for s in second] == ['Lime', 'Coconut']
+    assert user_client.get(f"/api/seltzers?limit=2&before={second[-1]['_id']}").get_json() == []
+    assert user_client.get('/api/seltzers?before=zzz').status_code == 400
+    assert user_client.get(f"/api/seltzers?before={'0' * 24}").status_code == 404
+
+def test_search(user_client):
+    log_seltzer(user_client, brand='LaCroix', flavor='Pamplemousse', notes='')
+    log_seltzer(user_client, brand='Bubly', flavor='Lime', notes='great with lunch')
+
+    def search(q, filter_type='all'):
+        results = user_client.get(f'/api/search?q={q}&filter={filter_type}').get_json()
+        return [s['brand'] for s in results]
+
+    assert search('lacroix', 'brand') == ['LaCroix']
+    assert search('lime', 'flavor') == ['Bubly']
+    assert search('LUNCH') == ['Bubly']
+    assert search('') == ['Bubly', 'LaCroix']
+
+def test_admin_routes_require_admin(user_client):
+    response = user_client.post('/api/brands', json={'brand_name': 'Waterloo'})
+    assert not response.get_json()['success']
+
+def test_admin_brand_and_flavor_management(admin_client):
+    response = admin_client.post('/api/brands', json={'brand_name': 'Waterloo', 'initial_flavors': ['Grape']})
+    assert response.get_json()['brand']['id'] == 'waterloo'
+    assert not admin_client.post('/api/brands', json={'brand_name': 'Waterloo'}).get_json()['success']
+
+    assert admin_client.post('/api/brands/waterloo/flavors', json={'flavor_name': 'Peach'}).get_json()['success']
+    assert not admin_client.post('/api/brands/waterloo/flavors', json={'flavor_name': 'Peach'}).get_json()['success']
+    admin_client.delete('/api/brands/waterloo/flavors', json={'flavor_name': 'Grape'})
+    brand = app_module.brands_collection.find_one({'id': 'waterloo'})
+    assert brand['flavors'] == ['Peach']
+
+    assert admin_client.delete('/api/brands/waterloo').get_json()['success']
+    assert app_module.brands_collection.find_one({'id': 'waterloo'}) is None
+
+def test_brand_in_use_cannot_be_deleted(admin_client):
+    log_seltzer(admin_client, brand_id='lacroix')
+    assert not admin_client.delete('/api/brands/lacroix').get_json()['success']
+
+def test_brands_etag_follows_catalog_version(admin_client):
+    etag = admin_client.get('/api/brands').headers['ETag']
+    assert admin_client.get('/api/brands', headers={'If-None-Match': etag}).status_code == 304
+
+    admin_client.post('/api/brands/polar/flavors', json={'flavor_name': 'Peach'})
+    assert admin_client.get('/api/brands', headers={'If-None-Match': etag}).status_code == 200
+
+def test_brand_batch(admin_client):
+    version = app_module.catalog_version()
+    response = admin_client.post('/api/brands/batch', json={'operations': [
+        {'op': 'create_brand', 'brand_name': 'Waterloo', 'initial_flavors': ['Grape']},
+        {'op': 'add_flavors', 'brand_id': 'waterloo', 'flavors': ['Peach', 'Grape', 'Lemon']},
+        {'op': 'remove_flavors', 'brand_id': 'waterloo', 'flavors': ['Lemon']},
+        {'op': 'rename', 'brand_id': 'waterloo', 'brand_name': 'Waterloo Sparkling'},
+    ]}).get_json()
+
+    assert response['success']
+    assert response['catalog_version'] == version + 1
+    brand = app_module.brands_collection.find_one({'id': 'waterloo'})
+    assert brand['name'] == 'Waterloo Sparkling'
+    assert brand['flavors'] == ['Grape', 'Peach']
+
+def test_brand_batch_validates_before_writing(admin_client):
+    response = admin_client.post('/api/brands/batch', json={'operations': [
+        {'op': 'create_brand', 'brand_name': 'Waterloo'},
+        {'op': 'add_flavors', 'brand_id': 'waterloo'},
+    ]}).get_json()
+
+    assert not response['success']
+    assert response['index'] == 1
+    assert app_module.brands_collection.find_one({'id': 'waterloo'}) is None
+
+def test_brand_batch_stops_at_duplicate(admin_client):
+    response = admin_client.post('/api/brands/batch', json={'operations': [
+        {'op': 'create_brand', 'brand_name': 'Waterloo'},
+        {'op': 'rename', 'brand_id': 'waterloo', 'brand_name': 'LaCroix'},
+        {'op': 'add_flavors', 'brand_id': 'waterloo', 'flavors': ['Peach']},
+    ]}).get_json()
+
+    assert not response['success']
+    assert response['applied'] == 1
+    assert app_module.brands_collection.find_one({'id': 'waterloo'})['flavors'] == []
+
+@pytest.mark.parametrize('operations', [
+    None,
+    'create_brand',
+    [None],
+    ['create_brand'],
+    [{'op': 'create_brand', 'brand_name': None}],
+    [{'op': 'create_brand', 'brand_name': 7}],
+    [{'op': 'create_brand', 'brand_name': 'Waterloo', 'initial_flavors': 'Grape'}],
+    [{'op': 'add_flavors', 'brand_id': 'polar', 'flavors': ['Peach', '']}],
+    [{'op': 'add_flavors', 'brand_id': 'polar', 'flavors': [3]}],
+    [{'op': 'rename', 'brand_id': ['polar'], 'brand_name': 'Polar'}],
+])
+def test_brand_batch_rejects_malformed_operations(admin_client, operations):
+    response = admin_client.post('/api/brands/batch', json={'operations': operations})
+    assert response.status_code == 200
+    assert not response.get_json()['success']
+    if isinstance(operations, list):
+        assert response.get_json()['index'] == 0
+
+def test_brand_batch_reports_unknown_brand(admin_client):
+    version = app_module.catalog_version()
+    response = admin_client.post('/api/brands/batch', json={'operations': [
+        {'op': 'add_flavors', 'brand_id': 'polar', 'flavors': ['Peach']},
+        {'op': 'rename', 'brand_id': 'nope', 'brand_name': 'Nope'},
+    ]}).get_json()
+
+    assert response == {'success': False, 'message': 'Brand not found', 'index': 1}
+    assert 'Peach' not in app_module.brands_collection.find_one({'id': 'polar'})['flavors']
+    assert app_module.catalog_version() == version
+
+def test_brand_batch_without_changes_keeps_version(admin_client):
+    version = app_module.catalog_version()
+    response = admin_client.post('/api/brands/batch', json={'operations': [
+        {'op': 'add_flavors', 'brand_id': 'polar', 'flavors': ['Lime']},
+    ]}).get_json()
+
+    assert response['success']
+    assert response['catalog_version'] == version
+
+def test_duplicate_brands_fall_back_to_checking_writes(storage):
+    storage.database()['brands'].insert_many([
+        {'id': 'polar', 'name': 'Polar Seltzer', 'flavors': []},
+        {'id': 'polar', 'name': 'Polar', 'flavors': []},
+    ])
+    app_module.app.config['TESTING'] = True
+    with app_module.app.test_client() as client:
+        register(client)
+        client.post('/admin/verify', json={'password': os.getenv('ADMIN_PASSWORD', 'admin123')})
+
+        assert not app_module.brand_indexes_unique()
+        assert not client.post('/api/brands', json={'brand_name': 'Polar'}).get_json()['success']
+        response = client.post('/api/brands/batch', json={'operations': [
+            {'op': 'create_brand', 'brand_name': 'Waterloo'},
+            {'op': 'create_brand', 'brand_name': 'Waterloo Sparkling', 'brand_id': 'waterloo'},
+        ]}).get_json()
+        assert response['index'] == 1
+        assert app_module.brands_collection.count_documents({'id': 'waterloo'}) == 0
+
+def test_rating_analytics_across_users(user_client):
+    for rating in [5, 4, 4]:
+        log_seltzer(user_client, rating=rating)
+    log_seltzer(user_client, flavor='Coconut', rating=1)
+    user_client.get('/logout')
+    register(user_client, 'otheruser')
+    log_seltzer(user_client, brand='Bubly', flavor='Cherry', rating=3)
+
+    analytics = user_client.get('/api/analytics/ratings').get_json()
+    assert analytics['overall']['count'] == 5
+    lacroix = analytics['brands'][0]
+    assert lacroix['brand'] == 'LaCroix'
+    assert lacroix['p50'] == 4
+    assert lacroix['distribution'] == {'1': 1, '4': 2, '5': 1}
+    assert [flavor['flavor'] for flavor in lacroix['flavors']] == ['Lime', 'Coconut']
+
+    filtered = user_client.get('/api/analytics/ratings?brand=Bubly').get_json()
+    assert [brand['brand'] for brand in filtered['brands']] == ['Bubly']
+    filtered = user_client.get('/api/analytics/ratings?brand=LaCroix&flavor=Coconut').get_json()
+    assert filtered['overall']['count'] == 1
+    assert [flavor['flavor'] for flavor in filtered['brands'][0]['flavors']] == ['Coconut']
+    assert user_client.get('/api/analytics/ratings?brand=Nope').get_json()['brands'] == []
+    # Filters are applied to the cached sketches rather than cached themselves
+    assert list(app_module._rating_analytics_cache) == ['histograms']
+
+def test_rating_analytics_follow_updates_and_deletes(user_client):
+    created = log_seltzer(user_client, rating=2)
+    user_client.put(f"/api/seltzers/{created['_id']}", json={'brand': 'LaCroix', 'flavor': 'Lime', 'rating': 5})
+    assert user_client.get('/api/analytics/ratings').get_json()['overall']['distribution'] == {'5': 1}
+
+    user_client.delete(f"/api/seltzers/{created['_id']}")
+    assert user_client.get('/api/analytics/ratings').get_json()['overall']['count'] == 0
+
+def test_rebuild_rating_sketches(user_client):
+    import rebuild_rating_sketches
+
+    log_seltzer(user_client, rating=3)
+    log_seltzer(user_client, rating=5)
+    app_module.rating_sketches_collection.delete_many({})
+
+    assert rebuild_rating_sketches.rebuild() == 1
+    app_module._rating_analytics_cache.clear()
+    assert user_client.get('/api/analytics/ratings').get_json()['overall']['distribution'] == {'3': 1, '5': 1}
+
+def test_rebuild_rating_sketches_counts_ndjson_archived_entries(user_client):
+    import rebuild_rating_sketches
+
+    user_id = str(app_module.users_collection.find_one({'username': 'testuser'})['_id'])
+    app_module.seltzer_rollups_collection.insert_many([
+        {'user_id': user_id, 'brand': 'Bubly', 'tier': 'ndjson', 'count': 3, 'rating_sum': 12},
+        {'user_id': user_id, 'brand': 'LaCroix', 'tier': 'collection', 'count': 2, 'rating_sum': 8},
+    ])
+    assert rebuild_rating_sketches.ndjson_archived_entries() == 3
+
+def test_schema_is_set_up_on_first_use(storage):
+    app_module.get_db()
+    indexes = storage.database()['seltzers'].index_information()
+    assert indexes['user_id_1_created_at_-1']['key'] == [('user_id', 1), ('created_at', -1)]
+
+def test_timeseries_mode_creates_collection_on_first_use(storage, monkeypatch):
+    monkeypatch.setattr(app_module, 'SELTZER_STORAGE_MODE', 'timeseries')
+    monkeypatch.setattr(app_module, 'SELTZERS_COLLECTION', 'seltzers_ts')
+    app_module.get_db()
+    info = next(storage.database().list_collections(filter={'name': 'seltzers_ts'}))
+    assert info['type'] == 'timeseries'
+
+def test_timeseries_mode_refuses_plain_collection(storage, monkeypatch):
+    monkeypatch.setattr(app_module, 'SELTZER_STORAGE_MODE', 'timeseries')
+    monkeypatch.setattr(app_module, 'SELTZERS_COLLECTION', 'seltzers_ts')
+    storage.database()['seltzers_ts'].insert_one({'user_id': 'a'})
+    with pytest.raises(CollectionInvalid):
+        app_module.get_db()
@@ -0,0 +1,74 @@
+import gzip
+from datetime import datetime, timedelta
+
+import pytest
+from bson import json_util
+
+import app as app_module
+from archive_seltzers import archive, write_to_collection, write_to_ndjson
+
+OLD = datetime.utcnow() - timedelta(days=800)
+CUTOFF = datetime.utcnow() - timedelta(days=365)
+
+def seed(storage):
+    app_module.seltzers_collection.insert_many([
+        {'user_id': 'a', 'brand': 'LaCroix', 'rating': 4, 'created_at': OLD},
+        {'user_id': 'a', 'brand': 'LaCroix', 'rating': 2, 'created_at': OLD + timedelta(days=1)},
+        {'user_id': 'a', 'brand': 'Bubly', 'rating': 5, 'created_at': OLD + timedelta(days=2)},
+        {'user_id': 'b', 'brand': 'LaCroix', 'rating': 3, 'created_at': OLD + timedelta(days=3)},
+        {'user_id': 'a', 'brand': 'LaCroix', 'rating': 1, 'created_at': datetime.utcnow()},
+    ])
+
+def rollup_totals():
+    totals = {}
+    for rollup in app_module.seltzer_rollups_collection.untargeted().find():
+        key = (rollup['user_id'], rollup['brand'])
+        count, rating_sum = totals.get(key, (0, 0))
+        totals[key] = (count + rollup['count'], rating_sum + rollup['rating_sum'])
+    return totals
+
+EXPECTED = {('a', 'LaCroix'): (2, 6), ('a', 'Bubly'): (1, 5), ('b', 'LaCroix'): (1, 3)}
+
+def archived_ndjson_ids(directory):
+    ids = []
+    for path in directory.iterdir():
+        with gzip.open(path, 'rt', encoding='utf-8') as f:
+            ids.extend(json_util.loads(line)['_id'] for line in f)
+    return ids
+
+@pytest.mark.parametrize('target', ['collection', 'ndjson'])
+def test_archive_moves_entries_and_folds_rollups(storage, tmp_path, target):
+    seed(storage)
+
+    assert archive(CUTOFF, target, tmp_path, dry_run=True) == 4
+    assert archive(CUTOFF, target, tmp_path, batch_size=3) == 4
+
+    assert app_module.seltzers_collection.untargeted().count_documents({}) == 1
+    if target == 'collection':
+        assert app_module.seltzers_archive_collection.untargeted().count_documents({}) == 4
+    else:
+        assert len(archived_ndjson_ids(tmp_path)) == 4
+    assert rollup_totals() == EXPECTED
+
+    assert archive(CUTOFF, target, tmp_path) == 0
+    assert rollup_totals() == EXPECTED
+
+def test_archive_recovers_from_crash_before_delete(storage):
+    seed(storage)
+    # An earlier run archived and folded this batch, then died before deleting it
+    batch = list(app_module.seltzers_collection.untargeted().find({'user_id': 'a', 'brand': 'LaCroix', 'created_at': {'$lt': CUTOFF}}))
+    write_to_collection(batch)
+
+    assert archive(CUTOFF) == 4
+    assert app_module.seltzers_archive_collection.untargeted().count_documents({}) == 4
+    assert rollup_totals() == EXPECTED
+
+def test_ndjson_archive_recovers_from_crash_before_delete(storage, tmp_path):
+    seed(storage)
+    batch = list(app_module.seltzers_collection.untargeted().find({'user_id': 'a', 'brand': 'LaCroix', 'created_at': {'$lt': CUTOFF}}))
+    write_to_ndjson(batch, tmp_path)
+
+    assert archive(CUTOFF, 'ndjson', tmp_path) == 4
+    ids = archived_ndjson_ids(tmp_path)
+    assert len(ids) == len(set(ids)) == 4
+    assert rollup_totals() == EXPECTED
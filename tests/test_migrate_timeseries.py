@@ -0,0 +1,41 @@
+from datetime import datetime
+
+import pytest
+from pymongo.errors import CollectionInvalid
+
+from migrate_timeseries import migrate
+from storage import MemoryDatabase
+
+@pytest.fixture
+def db():
+    db = MemoryDatabase()
+    db['seltzers'].insert_many([
+        {'user_id': 'a', 'rating': 4, 'date': '2025-10-01', 'time': '14:30', 'created_at': datetime(2025, 10, 2)},
+        {'user_id': 'a', 'rating': 3, 'created_at': datetime(2025, 10, 3)},
+        {'user_id': 'b', 'rating': 5, 'date': '2025-10-04', 'created_at': datetime(2025, 10, 4)},
+        {'user_id': 'b', 'rating': 1},
+    ])
+    return db
+
+def test_migrate_copies_with_consumed_at(db):
+    assert migrate(db, 'seltzers', 'seltzers_ts', batch_size=2) == (3, 1)
+
+    assert next(db.list_collections(filter={'name': 'seltzers_ts'}))['type'] == 'timeseries'
+    consumed = sorted(doc['consumed_at'] for doc in db['seltzers_ts'].find())
+    assert consumed == [datetime(2025, 10, 1, 14, 30), datetime(2025, 10, 3), datetime(2025, 10, 4)]
+    assert db['seltzers'].count_documents({}) == 4
+
+def test_migrate_is_resumable(db):
+    first = next(db['seltzers'].find().sort('_id', 1))
+    db.create_collection('seltzers_ts', timeseries={'timeField': 'consumed_at', 'metaField': 'user_id'})
+    db['seltzers_ts'].insert_one({**first, 'consumed_at': datetime(2025, 10, 1, 14, 30)})
+
+    assert migrate(db, 'seltzers', 'seltzers_ts', dry_run=True) == (2, 2)
+    assert migrate(db, 'seltzers', 'seltzers_ts') == (2, 2)
+    assert migrate(db, 'seltzers', 'seltzers_ts') == (0, 4)
+    assert db['seltzers_ts'].count_documents({}) == 3
+
+def test_migrate_refuses_plain_target(db):
+    db['seltzers_ts'].insert_one({'user_id': 'a'})
+    with pytest.raises(CollectionInvalid):
+        migrate(db, 'seltzers', 'seltzers_ts')
@@ -0,0 +1,72 @@
+import logging
+
+import pytest
+
+from shard_sim import ShardedMemoryStorage, shard_key_values, simulate
+from sharding import ShardKeyCollection, UntargetedQueryError, targets_shard_key
+from storage import MemoryDatabase
+
+def test_targets_shard_key():
+    assert targets_shard_key({'user_id': 'a', '_id': 1})
+    assert targets_shard_key({'user_id': {'$in': ['a', 'b']}})
+    assert targets_shard_key({'$and': [{'user_id': 'a'}, {'rating': 5}]})
+    assert targets_shard_key({'$or': [{'user_id': 'a'}, {'user_id': 'b'}]})
+    assert not targets_shard_key({'_id': 1})
+    assert not targets_shard_key({'user_id': {'$ne': 'a'}})
+    assert not targets_shard_key({'$or': [{'user_id': 'a'}, {'brand': 'Bubly'}]})
+    assert not targets_shard_key(None)
+
+def test_reject_mode_blocks_untargeted_operations():
+    collection = ShardKeyCollection(MemoryDatabase()['seltzers'], mode='reject')
+    collection.insert_one({'user_id': 'a', 'rating': 5})
+
+    assert collection.count_documents({'user_id': 'a'}) == 1
+    with pytest.raises(UntargetedQueryError):
+        collection.find({'rating': 5})
+    with pytest.raises(UntargetedQueryError):
+        collection.delete_one({'rating': 5})
+    with pytest.raises(UntargetedQueryError):
+        collection.insert_one({'rating': 1})
+    with pytest.raises(UntargetedQueryError):
+        collection.aggregate([{'$group': {'_id': '$user_id'}}])
+    assert collection.untargeted().count_documents({'rating': 5}) == 1
+
+def test_reject_mode_checks_find_one_and_modify():
+    collection = ShardKeyCollection(MemoryDatabase()['seltzers'], mode='reject')
+    collection.insert_one({'user_id': 'a', 'rating': 1})
+
+    with pytest.raises(UntargetedQueryError):
+        collection.find_one_and_update({'rating': 1}, {'$set': {'rating': 2}})
+    assert collection.find_one_and_update({'user_id': 'a'}, {'$set': {'rating': 2}})['rating'] == 1
+    # Unwrapped methods aren't passed through unchecked
+    with pytest.raises(AttributeError):
+        collection.watch
+    collection.create_index('user_id')
+    assert 'user_id_1' in collection.index_information()
+
+def test_warn_mode_logs_and_runs(caplog):
+    collection = ShardKeyCollection(MemoryDatabase()['seltzers'], mode='warn')
+    collection.insert_one({'user_id': 'a', 'rating': 5})
+    with caplog.at_level(logging.WARNING, logger='sharding'):
+        assert collection.count_documents({'rating': 5}) == 1
+    assert 'without shard key' in caplog.text
+
+def test_sharded_storage_routes_by_user():
+    storage = ShardedMemoryStorage(4)
+    seltzers = storage.database()['seltzers']
+    for user in range(20):
+        seltzers.insert_one({'user_id': f'user{user}', 'rating': 3})
+
+    assert sum(seltzers.documents_per_shard()) == 20
+    storage.operations.clear()
+    assert seltzers.count_documents({'user_id': 'user3'}) == 1
+    assert seltzers.count_documents({'rating': 3}) == 20
+    assert [shards for _, _, shards in storage.operations] == [1, 4]
+    assert shard_key_values({'user_id': {'$in': ['a', 'b']}}) == {'a', 'b'}
+
+def test_per_user_operations_stay_single_shard(storage):
+    summary, per_shard = simulate(num_shards=4, num_users=12, entries_per_user=3)
+
+    assert sum(per_shard) == 12 * 2
+    assert all(row['max_shards'] == 1 for row in summary.values())
+    assert ('seltzers', 'update_one') in summary
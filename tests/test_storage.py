@@ -0,0 +1,111 @@
+import threading
+from datetime import datetime
+
+import pytest
+from pymongo import UpdateOne, InsertOne, DeleteOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+
+from storage import MemoryDatabase
+
+@pytest.fixture
+def collection():
+    collection = MemoryDatabase()['items']
+    collection.insert_many([
+        {'user_id': 'a', 'brand': 'LaCroix', 'rating': 4, 'tags': ['fizzy'], 'created_at': datetime(2025, 1, 1)},
+        {'user_id': 'a', 'brand': 'Bubly', 'rating': 2, 'tags': [], 'created_at': datetime(2025, 1, 3)},
+        {'user_id': 'b', 'brand': 'LaCroix', 'rating': 5, 'created_at': datetime(2025, 1, 2)},
+    ])
+    return collection
+
+def test_query_operators(collection):
+    assert collection.count_documents({'user_id': 'a'}) == 2
+    assert collection.count_documents({'rating': {'$gte': 4}}) == 2
+    assert collection.count_documents({'created_at': {'$lt': datetime(2025, 1, 2)}}) == 1
+    assert collection.count_documents({'brand': {'$regex': 'lac', '$options': 'i'}}) == 2
+    assert collection.count_documents({'$or': [{'brand': 'Bubly'}, {'user_id': 'b'}]}) == 2
+    assert collection.count_documents({'tags': 'fizzy'}) == 1
+    assert collection.count_documents({'tags': {'$exists': False}}) == 1
+    assert collection.count_documents({'brand': {'$in': ['Bubly', 'Perrier']}}) == 1
+
+def test_sort_limit_and_copies(collection):
+    docs = list(collection.find({'user_id': 'a'}).sort('created_at', -1).limit(1))
+    assert [doc['brand'] for doc in docs] == ['Bubly']
+
+    docs[0]['brand'] = 'changed'
+    assert collection.find_one({'_id': docs[0]['_id']})['brand'] == 'Bubly'
+
+def test_aggregate_group_sort(collection):
+    result = list(collection.aggregate([
+        {'$group': {'_id': '$brand', 'count': {'$sum': 1}, 'avg': {'$avg': '$rating'}}},
+        {'$sort': {'count': -1}},
+        {'$limit': 1}
+    ]))
+    assert result == [{'_id': 'LaCroix', 'count': 2, 'avg': 4.5}]
+
+def test_update_operators_and_upsert(collection):
+    collection.update_one({'user_id': 'b'}, {'$push': {'tags': 'new'}, '$inc': {'rating': -1}})
+    doc = collection.find_one({'user_id': 'b'})
+    assert doc['tags'] == ['new'] and doc['rating'] == 4
+
+    collection.update_one({'user_id': 'a', 'brand': 'LaCroix'}, {'$pull': {'tags': 'fizzy'}})
+    assert collection.find_one({'brand': 'LaCroix', 'user_id': 'a'})['tags'] == []
+
+    result = collection.update_one({'user_id': 'c', 'brand': 'AHA'}, {'$inc': {'count': 2}}, upsert=True)
+    assert collection.find_one({'_id': result.upserted_id})['count'] == 2
+
+def test_delete(collection):
+    assert collection.delete_many({'user_id': 'a'}).deleted_count == 2
+    assert collection.count_documents({}) == 1
+
+def test_unique_index(collection):
+    collection.create_index([('user_id', 1), ('brand', 1)], unique=True)
+    with pytest.raises(DuplicateKeyError):
+        collection.insert_one({'user_id': 'a', 'brand': 'Bubly'})
+    with pytest.raises(DuplicateKeyError):
+        collection.update_one({'user_id': 'b'}, {'$set': {'user_id': 'a'}})
+
+    collection.delete_one({'user_id': 'a', 'brand': 'Bubly'})
+    collection.insert_one({'user_id': 'a', 'brand': 'Bubly'})
+
+def test_unique_index_treats_missing_as_null(collection):
+    with pytest.raises(DuplicateKeyError):
+        collection.create_index('sku', unique=True)
+
+def test_bulk_write(collection):
+    collection.create_index([('user_id', 1), ('brand', 1)], unique=True)
+    result = collection.bulk_write([
+        InsertOne({'user_id': 'c', 'brand': 'x'}),
+        UpdateOne({'user_id': 'b'}, {'$set': {'rating': 1}}),
+        DeleteOne({'brand': 'Bubly'}),
+    ])
+    assert (result.inserted_count, result.modified_count, result.deleted_count) == (1, 1, 1)
+
+    with pytest.raises(BulkWriteError) as error:
+        collection.bulk_write([InsertOne({'user_id': 'c', 'brand': 'x'}), InsertOne({'user_id': 'c', 'brand': 'y'})])
+    assert error.value.details['writeErrors'][0]['code'] == 11000
+    assert collection.count_documents({'brand': 'y'}) == 0
+
+def test_concurrent_writes_keep_indexes_consistent():
+    collection = MemoryDatabase()['items']
+    collection.create_index('name', unique=True)
+    collection.insert_one({'_id': 'counter', 'name': 'counter', 'n': 0})
+    duplicates = []
+
+    def work(thread):
+        for index in range(200):
+            collection.update_one({'_id': 'counter'}, {'$inc': {'n': 1}})
+            try:
+                collection.insert_one({'name': f'item{index}', 'thread': thread})
+            except DuplicateKeyError:
+                duplicates.append(index)
+            list(collection.find({'thread': thread}).limit(5))
+
+    threads = [threading.Thread(target=work, args=(thread,)) for thread in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert collection.find_one({'_id': 'counter'})['n'] == 800
+    assert collection.count_documents({'thread': {'$exists': True}}) == 200
+    assert len(duplicates) == 600